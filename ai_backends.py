@@ -0,0 +1,235 @@
+"""
+AI backends used by AIServices: Gemini, local stub and record/replay
+"""
+
+import os
+import json
+import hashlib
+import random
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", 60))
+
+
+def _blob_parts(parts):
+    """Yield (kind, bytes) for each prompt part"""
+    for part in parts:
+        if isinstance(part, dict):
+            yield part.get("mime_type", "application/octet-stream"), part["data"]
+        else:
+            yield "text/plain", str(part).encode()
+
+
+def request_fingerprint(parts, generation_config=None):
+    """Stable hash of a request, used by the stub and replay backends"""
+    digest = hashlib.sha256()
+    for kind, data in _blob_parts(parts):
+        digest.update(kind.encode())
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    if generation_config:
+        digest.update(json.dumps(generation_config, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def _has_image(parts):
+    return any(isinstance(part, dict) for part in parts)
+
+
+class AIBackend:
+    """Interface every backend implements"""
+    name = "base"
+    model_name = "base"
+
+    def generate(self, parts, generation_config=None):
+        """Return the model's text response for a list of prompt parts"""
+        raise NotImplementedError
+
+    def generate_stream(self, parts, generation_config=None):
+        """Yield the response in chunks, backends without streaming yield it whole"""
+        yield self.generate(parts, generation_config)
+
+
+class GeminiBackend(AIBackend):
+    """Google Gemini client, one model instance reused across calls"""
+    name = "gemini"
+
+    def __init__(self, api_key=None, model_name=None):
+        import google.generativeai as genai
+
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found")
+        genai.configure(api_key=api_key)
+        self.model_name = model_name or MODEL_NAME
+        self.model = genai.GenerativeModel(self.model_name)
+        print(" Gemini AI configured")
+
+    def generate(self, parts, generation_config=None):
+        response = self.model.generate_content(
+            parts, generation_config=generation_config, request_options={"timeout": GEMINI_TIMEOUT_SECONDS}
+        )
+        return response.text or ""
+
+    def generate_stream(self, parts, generation_config=None):
+        response = self.model.generate_content(
+            parts, generation_config=generation_config, stream=True,
+            request_options={"timeout": GEMINI_TIMEOUT_SECONDS}
+        )
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class StubBackend(AIBackend):
+    """
+    Deterministic offline backend for load tests.
+    The same request always produces the same response.
+    """
+    name = "stub"
+    model_name = "stub-v1"
+
+    FOODS = [
+        {"item": "Steamed Rice", "quantity": "1 cup", "calories": 205, "protein": 4, "fat": 0, "carbs": 45,
+         "nutrients": ["Manganese", "Selenium"]},
+        {"item": "Dal", "quantity": "1 bowl", "calories": 180, "protein": 12, "fat": 4, "carbs": 26,
+         "nutrients": ["Iron", "Folate"]},
+        {"item": "Grilled Chicken Breast", "quantity": "150 g", "calories": 248, "protein": 46, "fat": 5, "carbs": 0,
+         "nutrients": ["Vitamin B6", "Niacin"]},
+        {"item": "Green Salad", "quantity": "1 bowl", "calories": 35, "protein": 2, "fat": 0, "carbs": 7,
+         "nutrients": ["Vitamin A", "Vitamin K"]},
+        {"item": "Chapati", "quantity": "2 pieces", "calories": 240, "protein": 8, "fat": 6, "carbs": 40,
+         "nutrients": ["Fiber", "Magnesium"]},
+        {"item": "Greek Yogurt", "quantity": "1 cup", "calories": 130, "protein": 17, "fat": 4, "carbs": 8,
+         "nutrients": ["Calcium", "Vitamin B12"]},
+        {"item": "Banana", "quantity": "1 medium", "calories": 105, "protein": 1, "fat": 0, "carbs": 27,
+         "nutrients": ["Potassium", "Vitamin B6"]},
+        {"item": "Paneer Tikka", "quantity": "6 pieces", "calories": 320, "protein": 20, "fat": 22, "carbs": 8,
+         "nutrients": ["Calcium", "Phosphorus"]},
+    ]
+
+    MEALS = [
+        ("Dinner - Vegetable Khichdi", 450, ["Khichdi", "Cucumber raita", "Green salad"],
+         ["Rice", "Moong dal", "Mixed vegetables"]),
+        ("Snack - Fruit and Nut Bowl", 250, ["Apple slices", "Almonds", "Greek yogurt"],
+         ["Apple", "Almonds", "Yogurt"]),
+        ("Lunch - Grilled Chicken Wrap", 520, ["Chicken wrap", "Side salad", "Lemon water"],
+         ["Whole wheat tortilla", "Chicken breast", "Lettuce"]),
+        ("Breakfast - Oats Porridge", 350, ["Oats porridge", "Banana", "Walnuts"],
+         ["Rolled oats", "Milk", "Banana"]),
+    ]
+
+    def __init__(self, latency_ms=None, jitter_ms=None):
+        self.latency_ms = float(latency_ms if latency_ms is not None else os.getenv("AI_STUB_LATENCY_MS", 0))
+        self.jitter_ms = float(jitter_ms if jitter_ms is not None else os.getenv("AI_STUB_JITTER_MS", 0))
+
+    def _delay(self, rng):
+        """Simulated latency in seconds"""
+        delay = self.latency_ms + (rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0)
+        return max(0.0, delay / 1000)
+
+    def _respond(self, parts, rng):
+        if _has_image(parts):
+            foods = rng.sample(self.FOODS, rng.randint(1, 3))
+            return json.dumps({"foods": foods, "total_calories": sum(f["calories"] for f in foods)})
+
+        meal, calories, items, ingredients = rng.choice(self.MEALS)
+        lines = [f"Next Meal: {meal}", f"Calories: {calories}", "Food Items:"]
+        lines += [f"- {item}" for item in items]
+        lines.append("Ingredients:")
+        lines += [f"- {ingredient}" for ingredient in ingredients]
+        return "\n".join(lines)
+
+    def generate(self, parts, generation_config=None):
+        rng = random.Random(request_fingerprint(parts, generation_config))
+        delay = self._delay(rng)
+        if delay:
+            time.sleep(delay)
+        return self._respond(parts, rng)
+
+    def generate_stream(self, parts, generation_config=None):
+        rng = random.Random(request_fingerprint(parts, generation_config))
+        delay = self._delay(rng)
+        text = self._respond(parts, rng)
+        chunks = [text[i:i + 24] for i in range(0, len(text), 24)]
+        # First chunk after a fifth of the latency, the rest spread evenly
+        for index, chunk in enumerate(chunks):
+            if delay:
+                time.sleep(delay * (0.2 if index == 0 else 0.8 / max(1, len(chunks) - 1)))
+            yield chunk
+
+
+class ReplayMissError(LookupError):
+    """Raised when no recording exists for a request"""
+
+
+class ReplayBackend(AIBackend):
+    """
+    Serve saved responses from disk.
+    In record mode, misses are forwarded to an inner backend and saved.
+    """
+    name = "replay"
+
+    def __init__(self, directory=None, inner=None, record=False):
+        self.directory = Path(directory or os.getenv("AI_REPLAY_DIR", "recordings"))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.inner = inner
+        self.record = record
+        if record and inner is None:
+            raise ValueError("Record mode needs an inner backend")
+        self.model_name = f"replay:{inner.model_name if inner else MODEL_NAME}"
+
+    def _path(self, parts, generation_config):
+        return self.directory / f"{request_fingerprint(parts, generation_config)}.json"
+
+    def generate(self, parts, generation_config=None):
+        path = self._path(parts, generation_config)
+        if path.exists():
+            return json.loads(path.read_text(encoding="utf-8"))["text"]
+
+        if not self.record:
+            raise ReplayMissError(f"No recording for request {path.stem}")
+
+        text = self.inner.generate(parts, generation_config)
+        self._save(path, text)
+        return text
+
+    def generate_stream(self, parts, generation_config=None):
+        path = self._path(parts, generation_config)
+        if path.exists() or not self.record:
+            yield self.generate(parts, generation_config)
+            return
+
+        chunks = []
+        for chunk in self.inner.generate_stream(parts, generation_config):
+            chunks.append(chunk)
+            yield chunk
+        self._save(path, "".join(chunks))
+
+    def _save(self, path, text):
+        tmp = path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({"model": self.inner.model_name, "text": text}), encoding="utf-8")
+        tmp.replace(path)
+
+
+def create_backend(name=None):
+    """
+    Build the backend selected by AI_BACKEND:
+    gemini (default), stub, replay or record
+    """
+    name = (name or os.getenv("AI_BACKEND", "gemini")).lower()
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "stub":
+        return StubBackend()
+    if name == "replay":
+        return ReplayBackend()
+    if name == "record":
+        return ReplayBackend(inner=GeminiBackend(), record=True)
+    raise ValueError(f"Unknown AI_BACKEND: {name}")
\ No newline at end of file
@@ -4,27 +4,29 @@ Gemini AI integration for food analysis
 
 import os
 import json
-import re
-import google.generativeai as genai
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from PIL import Image
-import io
+from ai_backends import create_backend
+from cache import AnalysisCache, RecommendationCache
+from image_processing import image_preprocessor, ImageRejectedError
+from food_records import FoodAnalysis, AnalysisValidationError, FOOD_ANALYSIS_SCHEMA, extract_json_object
+from nutrient_reference import nutrient_reference, REFERENCE_VERSION
+from resilience import ai_guard, RateLimitedError, CircuitOpenError
 
 load_dotenv()
 
-class AIServices:
-    def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found")
-        genai.configure(api_key=api_key)
-        print(" Gemini AI configured")
-    
-    def analyze_food_image(self, image_bytes):
-        """
-        Analyze food image using Gemini AI
-        """
-        FOOD_ANALYSIS_PROMPT = '''
+ANALYSIS_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", 4))
+ANALYSIS_STRUCTURED_OUTPUT = os.getenv("ANALYSIS_STRUCTURED_OUTPUT", "1") not in ("0", "false", "False")
+NUTRIENT_REFERENCE_FILL = os.getenv("NUTRIENT_REFERENCE_FILL", "1") not in ("0", "false", "False")
+
+# Ask the model for JSON directly instead of JSON embedded in free text
+ANALYSIS_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": FOOD_ANALYSIS_SCHEMA
+}
+
+FOOD_ANALYSIS_PROMPT = '''
         You are a nutrition expert. Analyze the meal image.
         Return ONLY valid JSON in this structure:
 
@@ -45,30 +47,138 @@ class AIServices:
 
         No extra text, no explanation. Only JSON.
         '''
-        
+
+
+def parse_food_analysis(txt):
+    """
+    Parse a model response into a validated analysis dict
+    """
+    try:
+        data = json.loads(txt)
+    except ValueError:
+        # Free-text response: pull out the first balanced JSON object
+        raw = extract_json_object(txt)
+        if raw is None:
+            return {"error": "JSON not found", "raw": txt}
+        try:
+            data = json.loads(raw)
+        except ValueError as e:
+            return {"error": f"Invalid JSON: {e}", "raw": txt}
+
+    try:
+        # Missing macros come from the local reference table instead of another model call
+        enrich = nutrient_reference.fill_missing if NUTRIENT_REFERENCE_FILL else None
+        return FoodAnalysis.from_dict(data, enrich=enrich).to_dict()
+    except AnalysisValidationError as e:
+        return {"error": str(e), "raw": txt}
+
+
+def merge_analyses(results):
+    """
+    Merge per-image analyses of one meal into a single result
+    """
+    merged = {"foods": [], "total_calories": 0, "images_analyzed": 0}
+    errors = []
+    for index, result in enumerate(results, start=1):
+        if "error" in result:
+            errors.append(f"Image {index}: {result['error']}")
+            continue
+        foods = result.get("foods", [])
+        merged["foods"].extend(foods)
+        total = result.get("total_calories")
+        if total is None:
+            total = sum(food.get("calories", 0) or 0 for food in foods)
+        merged["total_calories"] += total
+        merged["images_analyzed"] += 1
+
+    if not merged["images_analyzed"]:
+        failed = {"error": "; ".join(errors) or "No images to analyze"}
+        if any(result.get("retryable") for result in results):
+            failed["retryable"] = True
+        return failed
+    if errors:
+        merged["warnings"] = errors
+    return merged
+
+
+class AIServices:
+    def __init__(self, backend=None, guard=None):
+        # Backend is chosen by AI_BACKEND (gemini, stub, replay, record)
+        self.backend = backend or create_backend()
+        # Rate limiter and circuit breaker shared by every session
+        self.guard = guard or ai_guard
+        self.analysis_cache = AnalysisCache()
+        self.recommendation_cache = RecommendationCache()
+        # Shared by all sessions so concurrent uploads stay bounded
+        self.executor = ThreadPoolExecutor(max_workers=ANALYSIS_MAX_WORKERS, thread_name_prefix="analysis")
+    
+    @staticmethod
+    def analysis_variant():
+        """Everything besides image, prompt and model that shapes a cached analysis"""
+        fill = f"fill{REFERENCE_VERSION}" if NUTRIENT_REFERENCE_FILL else "nofill"
+        output = "structured" if ANALYSIS_STRUCTURED_OUTPUT else "text"
+        return f"{image_preprocessor.config_key()}:{output}:{fill}"
+    
+    def analyze_food_image(self, image_bytes):
+        """
+        Analyze food image using Gemini AI
+        """
+        cache_key = AnalysisCache.make_key(
+            image_bytes, FOOD_ANALYSIS_PROMPT, self.backend.model_name, self.analysis_variant()
+        )
+        cached = self.analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
         try:
-            pil_img = Image.open(io.BytesIO(image_bytes))
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            response = model.generate_content([FOOD_ANALYSIS_PROMPT, pil_img])
-            txt = response.text or ""
-            
-            # Extract JSON from response
-            match = re.search(r"\{.*\}", txt, flags=re.S)
-            if not match:
-                return {"error": "JSON not found", "raw": txt}
-            
-            return json.loads(match.group(0))
+            upload_bytes, mime_type = image_preprocessor.process(image_bytes)
+            txt = self.guard.call(
+                self.backend.generate,
+                [FOOD_ANALYSIS_PROMPT, {"mime_type": mime_type, "data": upload_bytes}],
+                ANALYSIS_GENERATION_CONFIG if ANALYSIS_STRUCTURED_OUTPUT else None
+            )
+            result = parse_food_analysis(txt)
+            if "error" not in result:
+                self.analysis_cache.set(cache_key, result, time.perf_counter() - start)
+            return result
+        except ImageRejectedError as e:
+            return {"error": f"Image rejected: {e}"}
+        except (RateLimitedError, CircuitOpenError) as e:
+            # Nothing reached the model, the caller may retry later
+            return {"error": str(e), "retryable": True}
         except Exception as e:
             return {"error": str(e)}
+
+    def analyze_meal_images(self, images):
+        """
+        Analyze several photos of one meal concurrently and merge them
+        """
+        if len(images) == 1:
+            return self.analyze_food_image(images[0])
+        results = list(self.executor.map(self.analyze_food_image, images))
+        return merge_analyses(results)
+
+    def get_cache_stats(self):
+        """
+        Hit/miss counters for the analysis and recommendation caches
+        """
+        return {
+            "analysis": self.analysis_cache.stats(),
+            "recommendation": self.recommendation_cache.stats()
+        }
+
+    def get_guard_stats(self):
+        """
+        Rate limiter and circuit breaker counters
+        """
+        return self.guard.stats()
     
-    def generate_recommendation(self, user_doc, log_doc):
+    def build_recommendation_prompt(self, state):
         """
-        Generate next meal recommendation
+        Build the next meal prompt from a normalized nutrition state
         """
-        total_today = sum([int(m.get("total_calories", 0)) for m in log_doc.get("meals", [])])
-        remaining = int(user_doc.get("daily_calorie_target", 0)) - total_today
-        
-        prompt = f'''
+        return f'''
         You are a nutrition expert. Based on user's profile and today's meals, suggest the next meal.
         Return ONLY in this exact format:
 
@@ -84,24 +194,125 @@ class AIServices:
         - [Ingredient 3]
 
         User Profile:
-        - Name: {user_doc.get("name")}
-        - Goal: {user_doc.get("goal")}
-        - Dietary Preference: {user_doc.get("dietary_preference", "none")}
-        - Daily Calorie Target: {user_doc.get("daily_calorie_target", 1500)}
-        - Remaining Calories: {remaining}
+        - Goal: {state["goal"]}
+        - Dietary Preference: {state["dietary_preference"]}
+        - Daily Calorie Target: {state["daily_calorie_target"]}
+        - Remaining Calories: about {state["remaining"]}
 
         Today's meals so far:
-        {[m.get('meal_name', 'Unknown') for m in log_doc.get('meals', [])]}
+        {state["meals"]}
 
         Keep it short. Only meal name, calories, food items, and ingredients in bullet points.
         '''
-        
+
+    def _recommendation_request(self, user_doc, log_doc):
+        # Users in the same nutrition state share a prompt and a cache entry
+        state = self.recommendation_cache.nutrition_state(user_doc, log_doc)
+        key = RecommendationCache.make_key(state, self.backend.model_name)
+        return key, self.build_recommendation_prompt(state)
+
+    def generate_recommendation(self, user_doc, log_doc):
+        """
+        Generate next meal recommendation
+        """
+        key, prompt = self._recommendation_request(user_doc, log_doc)
+        cached = self.recommendation_cache.get(key)
+        if cached is not None:
+            return cached
+
         try:
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            response = model.generate_content([prompt])
-            return response.text
+            text = self.guard.call(self.backend.generate, [prompt])
         except Exception as e:
             return f"Error: {e}"
+        if text.strip():
+            self.recommendation_cache.set(key, text)
+        return text
+
+    def stream_recommendation(self, user_doc, log_doc):
+        """
+        Generate next meal recommendation, yielding text chunks as they arrive
+        """
+        key, prompt = self._recommendation_request(user_doc, log_doc)
+        cached = self.recommendation_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        try:
+            for chunk in self.guard.stream(self.backend.generate_stream, [prompt]):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            yield f"\nError: {e}"
+            return
+        text = "".join(chunks)
+        if text.strip():
+            self.recommendation_cache.set(key, text)
+
+
+class RecommendationStreamParser:
+    """
+    Incremental parser for the "Next Meal:/Calories:/Food Items:/Ingredients:"
+    recommendation format. feed() returns sections as soon as they are complete:
+    ("next_meal", line), ("calories", line), ("food_items", [lines]),
+    ("ingredients", [lines]) or ("text", line).
+    """
+    HEADERS = (
+        ("Next Meal:", "next_meal"),
+        ("Calories:", "calories"),
+        ("Food Items:", "food_items"),
+        ("Ingredients:", "ingredients"),
+    )
+    LIST_SECTIONS = ("food_items", "ingredients")
+
+    def __init__(self):
+        self._buffer = ""
+        self._list = None
+
+    def feed(self, chunk):
+        """Add a chunk of text, return the sections it completed"""
+        self._buffer += chunk
+        if "\n" not in self._buffer:
+            return []
+        lines = self._buffer.split("\n")
+        self._buffer = lines.pop()
+        events = []
+        for line in lines:
+            events.extend(self._parse_line(line.strip()))
+        return events
+
+    def close(self):
+        """Flush whatever is left at the end of the stream"""
+        events = self._parse_line(self._buffer.strip()) if self._buffer else []
+        self._buffer = ""
+        events.extend(self._flush_list())
+        return events
+
+    def _flush_list(self):
+        if self._list is None:
+            return []
+        section, self._list = self._list, None
+        return [section]
+
+    def _parse_line(self, line):
+        for prefix, kind in self.HEADERS:
+            if line.startswith(prefix):
+                events = self._flush_list()
+                if kind in self.LIST_SECTIONS:
+                    self._list = (kind, [])
+                else:
+                    events.append((kind, line))
+                return events
+
+        if not line:
+            return []
+        if self._list is not None and line.startswith("-"):
+            self._list[1].append(line)
+            return []
+        events = self._flush_list()
+        events.append(("text", line))
+        return events
 
 # Global AI service instance
 ai_service = AIServices()
\ No newline at end of file
@@ -3,7 +3,6 @@ NUTRI LENS - AI Nutrition Assistant
 Complete Streamlit Application
 """
 import os
-import io
 import streamlit as st
 import pandas as pd
 import altair as alt
@@ -12,10 +11,14 @@ from datetime import date, datetime, timedelta
 
 # Import your modular components
 try:
-    from database import db
-    from auth import auth
-    from ai_services import ai_service
-    from utils import NutritionCalculator, DataManager
+    from database import get_database
+    from auth import auth, PasswordHashingBusyError
+    from throttle import LoginThrottledError, client_address
+    from user_store import user_store
+    from ai_services import ai_service, RecommendationStreamParser
+    from utils import NutritionCalculator, DataManager, HISTORY_RANGES, HISTORY_GRANULARITIES
+    from jobs import (job_queue, JobWorkerPool, ANALYSIS_MODE, JOB_POLL_SECONDS,
+                      STATUS_QUEUED, STATUS_RUNNING, STATUS_FAILED)
     
     print(" All modules loaded successfully")
     
@@ -27,6 +30,7 @@ except ImportError as e:
     - auth.py  
     - ai_services.py
     - utils.py
+    - jobs.py
     """)
     st.stop()
 
@@ -37,6 +41,14 @@ st.set_page_config(
     layout="wide"
 )
 
+# SHARED RESOURCES
+@st.cache_resource
+def load_database():
+    """One pooled MongoDB client per server process, connected on first query"""
+    return get_database()
+
+db = load_database()
+
 # SESSION STATE INITIALIZATION
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -51,6 +63,14 @@ def logout():
     st.session_state.edit_mode = False
     st.rerun()
 
+def client_id():
+    """Best-effort client address for login throttling"""
+    context = getattr(st, "context", None)
+    if context is None:
+        return None
+    headers = getattr(context, "headers", None) or {}
+    return client_address(getattr(context, "ip_address", None), headers.get("X-Forwarded-For", ""))
+
 def display_logo():
     """Display application logo"""
     logo_paths = [
@@ -73,6 +93,223 @@ def display_logo():
     st.info("Upload 'nutri logo.png' to the assets folder")
 
 
+def show_analysis_results(parsed):
+    """Display the foods table and total calories of an analyzed meal"""
+    st.subheader(" Analysis Results")
+
+    # Create DataFrame for display
+    foods_data = []
+    for food in parsed.get("foods", []):
+        foods_data.append({
+            "Food Item": food.get("item", "Unknown"),
+            "Quantity": food.get("quantity", "N/A"),
+            "Calories": f"{food.get('calories', 0)} kcal",
+            "Protein": f"{food.get('protein', 0)}g",
+            "Carbs": f"{food.get('carbs', 0)}g",
+            "Fat": f"{food.get('fat', 0)}g"
+        })
+
+    if foods_data:
+        df = pd.DataFrame(foods_data)
+        st.dataframe(df, use_container_width=True)
+
+    # Display total calories
+    total_cal = parsed.get("total_calories", 0)
+    st.metric("Total Meal Calories", f"{total_cal} kcal")
+
+def render_recommendation_section(section):
+    """Render one parsed section of a next meal recommendation"""
+    kind, value = section
+    if kind == "next_meal":
+        st.subheader(value)
+    elif kind == "calories":
+        st.metric("Approximate Calories", value.replace('Calories:', '').strip())
+    elif kind in ("food_items", "ingredients"):
+        st.write("**Food Items:**" if kind == "food_items" else "**Ingredients:**")
+        for line in value:
+            st.write(line)
+    else:
+        st.write(value)
+
+def show_recommendation(recommendation_text):
+    """Format a next meal recommendation for display"""
+    parser = RecommendationStreamParser()
+    for section in parser.feed(recommendation_text) + parser.close():
+        render_recommendation_section(section)
+
+def stream_recommendation(user_doc, log_doc):
+    """Render a next meal recommendation section by section as it streams in"""
+    parser = RecommendationStreamParser()
+    placeholder = st.empty()
+    placeholder.caption(" Thinking about your next meal...")
+    for chunk in ai_service.stream_recommendation(user_doc, log_doc):
+        for section in parser.feed(chunk):
+            placeholder.empty()
+            render_recommendation_section(section)
+    for section in parser.close():
+        render_recommendation_section(section)
+    placeholder.empty()
+
+def render_meal_jobs():
+    """Show background analysis jobs submitted in this session"""
+    jobs = job_queue.get_jobs(st.session_state.meal_jobs)
+    pending = False
+
+    for job in jobs:
+        status = job.get("status")
+        label = f"{job.get('meal_type', 'Meal')} - {job['created_at'].strftime('%H:%M:%S')} UTC"
+        if status in (STATUS_QUEUED, STATUS_RUNNING):
+            pending = True
+            st.info(f" {label}: {'analyzing' if status == STATUS_RUNNING else 'waiting in queue'}...")
+        elif status == STATUS_FAILED:
+            st.error(f" {label}: failed to analyze image: {job.get('error')}")
+        else:
+            result = job.get("result", {})
+            with st.expander(f" {label}: saved to your food log", expanded=job["_id"] == jobs[0]["_id"]):
+                for warning in result.get("warnings", []):
+                    st.warning(f"Skipped {warning}")
+                show_analysis_results(result)
+                if result.get("recommendation"):
+                    st.divider()
+                    st.write("** Next Meal Recommendation**")
+                    show_recommendation(result["recommendation"])
+    return pending
+
+def show_meal_jobs():
+    """Poll job status while any job is still pending"""
+    st.subheader(" Recent Uploads")
+    fragment = getattr(st, "fragment", None)
+    if fragment is None:
+        if render_meal_jobs():
+            st.button("Refresh status", key="refresh_jobs")
+        return
+
+    @fragment(run_every=JOB_POLL_SECONDS)
+    def poll_jobs():
+        if not render_meal_jobs():
+            # Everything finished: rerun the page once to stop polling
+            st.session_state.meal_jobs_settled = list(st.session_state.meal_jobs)
+            st.rerun()
+
+    if st.session_state.get("meal_jobs_settled") == st.session_state.meal_jobs:
+        render_meal_jobs()
+    else:
+        poll_jobs()
+
+def show_macro_trends(df, daily_target, goal):
+    """Macro series and macro split against the goal, from the history rollups"""
+    st.subheader(" Macro Trends")
+    macro_targets = NutritionCalculator.macro_targets(daily_target, goal)
+    logged = df[df["Days Logged"] > 0]
+
+    # Average grams per logged day in each period
+    per_day = logged[["Date", "Period"]].copy()
+    for macro in ("Protein", "Carbs", "Fat"):
+        per_day[macro] = (logged[macro] / logged["Days Logged"]).round(1)
+    series = per_day.melt(id_vars=["Date", "Period"], var_name="Macro", value_name="Grams")
+
+    lines = alt.Chart(series).mark_line(point=True).encode(
+        x=alt.X("Date:T", title="Date", axis=alt.Axis(format="%b %d")),
+        y=alt.Y("Grams:Q", title="Grams per day"),
+        color=alt.Color("Macro:N"),
+        tooltip=["Period:N", "Macro:N", "Grams:Q"]
+    )
+    target_rules = alt.Chart(pd.DataFrame({
+        "Macro": [macro.title() for macro in macro_targets],
+        "Grams": list(macro_targets.values())
+    })).mark_rule(strokeDash=[5, 5]).encode(y="Grams:Q", color="Macro:N")
+    st.altair_chart(lines + target_rules, use_container_width=True)
+    st.caption("Dashed lines: daily targets for your goal")
+
+    # Share of macro calories, actual vs goal
+    actual = NutritionCalculator.macro_ratios(logged["Protein"].sum(), logged["Carbs"].sum(), logged["Fat"].sum())
+    goal_split = NutritionCalculator.macro_ratios(*(macro_targets[m] for m in ("protein", "carbs", "fat")))
+    ratio_df = pd.DataFrame([
+        {"Source": source, "Macro": macro.title(), "Percent": round(share * 100, 1)}
+        for source, ratios in (("Actual", actual), ("Goal", goal_split))
+        for macro, share in ratios.items()
+    ])
+    ratio_chart = alt.Chart(ratio_df).mark_bar().encode(
+        x=alt.X("Percent:Q", title="% of macro calories", scale=alt.Scale(domain=[0, 100])),
+        y=alt.Y("Source:N", title=None),
+        color=alt.Color("Macro:N"),
+        tooltip=["Source:N", "Macro:N", "Percent:Q"]
+    )
+    st.altair_chart(ratio_chart, use_container_width=True)
+
+    days_logged = max(1, int(logged["Days Logged"].sum()))
+    macro_cols = st.columns(3)
+    for macro_col, macro in zip(macro_cols, ("protein", "carbs", "fat")):
+        with macro_col:
+            avg = logged[macro.title()].sum() / days_logged
+            st.metric(f"Avg {macro.title()}", f"{avg:.0f} g", f"{avg - macro_targets[macro]:+.0f} g vs target",
+                      delta_color="off")
+
+def show_history_browser(user_id):
+    """Page through past days, newest first, one keyset page at a time"""
+    st.subheader(" Meal History")
+
+    # Cursors of the pages visited so far, the first page has none
+    if st.session_state.get("history_user") != user_id:
+        st.session_state.history_user = user_id
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+
+    logs, next_cursor = DataManager.get_history_page(user_id, before=cursors[-1])
+    if not logs:
+        st.info("No meals logged yet.")
+        return
+
+    for log in logs:
+        totals = DataManager.get_day_totals(log)
+        day_label = datetime.strptime(log["date"], "%Y-%m-%d").strftime("%a, %b %d %Y")
+        with st.expander(f"{day_label} — {totals['calories']:.0f} kcal, {totals['meals']} meals"):
+            meals = log.get("meals", [])
+            st.dataframe(pd.DataFrame([{
+                "Meal": meal.get("meal_name", "Meal"),
+                "Time": meal.get("time", ""),
+                "Calories": meal.get("total_calories", 0)
+            } for meal in meals]), use_container_width=True)
+            if st.button("Show foods", key=f"history_foods_{log['date']}"):
+                full_log = DataManager.get_day_log(user_id, log["date"])
+                for meal in (full_log or {}).get("meals", []):
+                    st.write(f"**{meal.get('meal_name', 'Meal')}** ({meal.get('time', '')})")
+                    st.dataframe(pd.DataFrame([{
+                        "Food Item": food.get("item", "Unknown"),
+                        "Quantity": food.get("quantity", "N/A"),
+                        "Calories": food.get("calories", 0),
+                        "Protein": food.get("protein", 0),
+                        "Carbs": food.get("carbs", 0),
+                        "Fat": food.get("fat", 0)
+                    } for food in meal.get("foods", [])]), use_container_width=True)
+
+    col_newer, col_page, col_older = st.columns([1, 2, 1])
+    with col_newer:
+        if st.button("← Newer", disabled=len(cursors) == 1, key="history_newer"):
+            cursors.pop()
+            st.rerun()
+    with col_page:
+        st.caption(f"Page {len(cursors)}")
+    with col_older:
+        if st.button("Older →", disabled=next_cursor is None, key="history_older"):
+            cursors.append(next_cursor)
+            st.rerun()
+
+@st.cache_resource
+def ensure_indexes():
+    """Apply the index registry once per process (failures are not cached)"""
+    from indexes import apply_indexes
+    for col_name, report in apply_indexes().items():
+        for index_name, status in report:
+            if status not in ("exists", "created", "rebuilt", "ttl updated"):
+                print(f" Index {col_name}.{index_name}: {status}")
+
+@st.cache_resource
+def start_job_workers():
+    """Start in-process analysis workers once per server process"""
+    return JobWorkerPool(job_queue).start()
+
+
 # AUTHENTICATION PAGES
 def show_login_page():
     """Display login page with tabs"""
@@ -99,7 +336,11 @@ def show_login_page():
                         if not username or not password:
                             st.error("Please enter both username and password")
                         else:
-                            user_doc = auth.authenticate(username, password)
+                            try:
+                                user_doc = auth.authenticate(username, password, client_id())
+                            except (LoginThrottledError, PasswordHashingBusyError) as e:
+                                st.warning(str(e))
+                                st.stop()
                             if user_doc:
                                 st.session_state.logged_in = True
                                 st.session_state.user = user_doc
@@ -127,10 +368,13 @@ def show_login_page():
                             elif new_password != confirm_password:
                                 st.error("Passwords do not match")
                             else:
-                                if auth.reset_password(recover_username, new_password):
-                                    st.success("Password reset successfully! You can now login with your new password.")
-                                else:
-                                    st.error("Username not found. Please check your username.")
+                                try:
+                                    if auth.reset_password(recover_username, new_password):
+                                        st.success("Password reset successfully! You can now login with your new password.")
+                                    else:
+                                        st.error("Username not found. Please check your username.")
+                                except PasswordHashingBusyError as e:
+                                    st.warning(str(e))
 
                 # Forgot User ID
                 with st.expander(" Forgot User ID"):
@@ -153,9 +397,7 @@ def show_login_page():
         with register_tab:
             st.header("Register New User")
 
-            # Get next user ID
-            next_number = db.get_next_user_id()
-            st.info(f"Your auto-generated User ID will be: **user{next_number}**")
+            st.info("Your User ID is generated when you create the account")
 
             # Registration Form
             with st.form("reg", clear_on_submit=True):
@@ -219,8 +461,18 @@ def show_login_page():
                             age, gender, height, weight, activity_selected, goal
                         )
 
-                        # Prepare user document
+                        # Hash first so a busy bcrypt pool doesn't use up a user number
+                        try:
+                            password_hash = auth.hash_password(password)
+                        except PasswordHashingBusyError as e:
+                            st.warning(str(e))
+                            st.stop()
+
+                        # Reserve the user number only now that the form is valid
+                        next_number = db.get_next_user_id()
                         auto_userid = f"user{next_number}"
+
+                        # Prepare user document
                         user_doc = {
                             "user_id_number": next_number,
                             "username": auto_userid,
@@ -234,7 +486,7 @@ def show_login_page():
                             "dietary_preference": dietary_pref,
                             "activity_level": activity_selected,
                             "daily_calorie_target": daily_target,
-                            "password_hash": auth.hash_password(password),
+                            "password_hash": password_hash,
                             "allergies": allergy_list,
                             "registration_date": datetime.now().isoformat()
                         }
@@ -264,6 +516,11 @@ def show_login_page():
 # MAIN APPLICATION PAGES (Logged In)
 def show_main_app():
     """Display main application after login"""
+    # Refresh the profile from the user store, picks up edits made elsewhere
+    fresh_user = user_store.get(st.session_state.user["username"])
+    if fresh_user:
+        st.session_state.user = fresh_user
+
     welcome_user = st.session_state.user.get('name', 'User')
     st.success(f" Welcome, {welcome_user}! | User ID: {st.session_state.user.get('username', 'N/A')}")
 
@@ -272,7 +529,7 @@ def show_main_app():
         " Upload Meal",
         " Profile",
         " Today",
-        " Last 7 Days",
+        " History",
         " Logout"
     ])
 
@@ -287,7 +544,12 @@ def show_main_app():
             with st.form("upload_meal_form"):
                 st.subheader("Meal Details")
                 meal_type = st.selectbox("Meal Type", ["Breakfast", "Lunch", "Dinner", "Snack"])
-                meal_image = st.file_uploader("Upload Meal Image", type=["jpg", "png", "jpeg"])
+                meal_images = st.file_uploader(
+                    "Upload Meal Image(s)",
+                    type=["jpg", "png", "jpeg"],
+                    accept_multiple_files=True,
+                    help="Add one photo per plate; they are analyzed together as one meal"
+                )
                 notes = st.text_area("Additional Notes (Optional)", placeholder="Any special notes about this meal...")
 
                 submit_upload = st.form_submit_button(" Analyze & Save Meal", use_container_width=True)
@@ -296,7 +558,7 @@ def show_main_app():
             st.subheader(" How it works:")
             st.markdown('''
             1. **Select** your meal type
-            2. **Upload** a clear photo of your meal
+            2. **Upload** clear photos of your meal (one per plate)
             3. **Click** Analyze & Save
             4. Get **instant nutrition analysis**
 
@@ -307,72 +569,47 @@ def show_main_app():
             ''')
 
         if submit_upload:
-            if not meal_image:
+            if not meal_images:
                 st.error("Please upload an image before submitting.")
             else:
                 # Read image bytes
-                image_bytes = meal_image.read()
-
-                with st.spinner(" Analyzing your meal..."):
-                    parsed = ai_service.analyze_food_image(image_bytes)
+                images = [meal_image.read() for meal_image in meal_images]
 
-                if "error" in parsed:
-                    st.error(f"Failed to analyze image: {parsed.get('error')}")
+                if ANALYSIS_MODE == "background":
+                    # Queue for the workers and return right away
+                    job_id = job_queue.submit(user_id, meal_type, images, notes)
+                    st.session_state.meal_jobs = [job_id] + st.session_state.get("meal_jobs", [])[:4]
+                    st.info(f" {meal_type} queued for analysis. Results will appear below.")
                 else:
-                    st.success(" Meal analyzed successfully!")
-
-                    # Display results
-                    st.subheader(" Analysis Results")
-
-                    # Create DataFrame for display
-                    foods_data = []
-                    for food in parsed.get("foods", []):
-                        foods_data.append({
-                            "Food Item": food.get("item", "Unknown"),
-                            "Quantity": food.get("quantity", "N/A"),
-                            "Calories": f"{food.get('calories', 0)} kcal",
-                            "Protein": f"{food.get('protein', 0)}g",
-                            "Carbs": f"{food.get('carbs', 0)}g",
-                            "Fat": f"{food.get('fat', 0)}g"
-                        })
-
-                    if foods_data:
-                        df = pd.DataFrame(foods_data)
-                        st.dataframe(df, use_container_width=True)
-
-                    # Display total calories
-                    total_cal = parsed.get("total_calories", 0)
-                    st.metric("Total Meal Calories", f"{total_cal} kcal")
-
-                    # Add notes to parsed data
-                    if notes:
-                        parsed["notes"] = notes
-
-                    # Save meal to DB using DataManager
-                    DataManager.save_meal_log(user_id, meal_type, parsed, notes)
-                    st.info(f" {meal_type} saved to your food log!")
-
-                    # Show SIMPLE recommendation
-                    log_doc = DataManager.get_today_log(user_id)
-                    if log_doc:
-                        with st.expander(" Next Meal Recommendation", expanded=True):
-                            recommendation_text = ai_service.generate_recommendation(st.session_state["user"], log_doc)
-
-                            # Format the response for better display
-                            lines = recommendation_text.split('\n')
-                            for line in lines:
-                                if line.startswith('Next Meal:'):
-                                    st.subheader(line)
-                                elif line.startswith('Calories:'):
-                                    st.metric("Approximate Calories", line.replace('Calories: ', ''))
-                                elif line.startswith('Food Items:'):
-                                    st.write("**Food Items:**")
-                                elif line.startswith('Ingredients:'):
-                                    st.write("**Ingredients:**")
-                                elif line.startswith('-'):
-                                    st.write(line)
-                                elif line.strip():
-                                    st.write(line)
+                    spinner_text = " Analyzing your meal..." if len(images) == 1 else f" Analyzing {len(images)} plates..."
+                    with st.spinner(spinner_text):
+                        parsed = ai_service.analyze_meal_images(images)
+
+                    if "error" in parsed:
+                        st.error(f"Failed to analyze image: {parsed.get('error')}")
+                    else:
+                        st.success(" Meal analyzed successfully!")
+                        for warning in parsed.pop("warnings", []):
+                            st.warning(f"Skipped {warning}")
+
+                        show_analysis_results(parsed)
+
+                        # Add notes to parsed data
+                        if notes:
+                            parsed["notes"] = notes
+
+                        # Save meal to DB using DataManager
+                        DataManager.save_meal_log(user_id, meal_type, parsed, notes)
+                        st.info(f" {meal_type} saved to your food log!")
+
+                        # Show SIMPLE recommendation
+                        log_doc = DataManager.get_today_log(user_id)
+                        if log_doc:
+                            with st.expander(" Next Meal Recommendation", expanded=True):
+                                stream_recommendation(st.session_state["user"], log_doc)
+
+        if st.session_state.get("meal_jobs"):
+            show_meal_jobs()
 
     # TAB 2 — PROFILE
     with tab2:
@@ -389,10 +626,10 @@ def show_main_app():
             st.subheader("Profile Image")
             if u.get("profile_img_id"):
                 try:
-                    img_data = db.get_profile_image(u["profile_img_id"])
-                    if img_data:
-                        img = Image.open(io.BytesIO(img_data))
-                        st.image(img, width=200)
+                    # Small cached thumbnail instead of decoding the original
+                    thumb_data = db.get_profile_thumbnail(u["profile_img_id"])
+                    if thumb_data:
+                        st.image(thumb_data, width=200)
                 except:
                     st.image("https://cdn-icons-png.flaticon.com/512/149/149071.png", width=150)
             else:
@@ -410,10 +647,7 @@ def show_main_app():
                     # Save new image
                     fs_id = db.save_profile_image(u['username'], new_img.read())
                     if fs_id:
-                        db.users_col.update_one(
-                            {"username": u["username"]},
-                            {"$set": {"profile_img_id": fs_id}}
-                        )
+                        auth.update_user_profile(u["username"], {"profile_img_id": fs_id})
                         st.session_state["user"]["profile_img_id"] = fs_id
                         st.success("Profile image updated!")
                         st.rerun()
@@ -660,8 +894,9 @@ def show_main_app():
             with col2:
                 st.metric("Daily Target", f"{daily_target} kcal")
         else:
-            # Calculate totals
-            total_calories = sum([m.get("total_calories", 0) for m in log["meals"]])
+            # Totals come from the day's rollup fields
+            totals = DataManager.get_day_totals(log)
+            total_calories = totals["calories"]
             remaining = max(0, daily_target - total_calories)
 
             # Display metrics in columns
@@ -673,6 +908,14 @@ def show_main_app():
             with col3:
                 st.metric("Daily Target", f"{daily_target} kcal")
 
+            # Macros against the goal's targets, straight from the rollups
+            macro_targets = NutritionCalculator.macro_targets(daily_target, st.session_state["user"].get("goal"))
+            macro_cols = st.columns(3)
+            for macro_col, macro in zip(macro_cols, ("protein", "carbs", "fat")):
+                with macro_col:
+                    st.metric(macro.title(), f"{totals[macro]:.0f} g", help=f"Target {macro_targets[macro]} g")
+                    st.progress(min(1.0, totals[macro] / max(1, macro_targets[macro])))
+
             # Simple target message
             st.divider()
             if total_calories <= daily_target:
@@ -688,33 +931,59 @@ def show_main_app():
                         for food in meal["foods"]:
                             st.write(f"• **{food.get('item', 'Unknown')}** - {food.get('calories', 0)} kcal")
 
-    # TAB 4 — LAST 7 DAYS
+            # On-demand recommendation, streamed so the first section shows up quickly
+            if st.button(" Suggest My Next Meal", key="today_recommendation"):
+                with st.expander(" Next Meal Recommendation", expanded=True):
+                    stream_recommendation(st.session_state["user"], log)
+
+    # TAB 4 — HISTORY
     with tab4:
-        st.header(" Last 7 Days Trend")
+        st.header(" Calorie History")
         user_id = st.session_state["user"]["username"]
         daily_target = st.session_state["user"].get("daily_calorie_target", 1500)
-        
-        # Get weekly data using DataManager
-        weekly_logs = DataManager.get_weekly_data(user_id, days=7)
-        df = DataManager.create_weekly_dataframe(weekly_logs, daily_target)
 
-        if df.empty:
-            st.warning("No meal data available for the last 7 days.")
+        # Range and grouping, aggregated server-side
+        range_col, group_col = st.columns(2)
+        with range_col:
+            range_label = st.selectbox("Range", list(HISTORY_RANGES) + ["Custom"], key="history_range")
+        today = date.today()
+        if range_label == "Custom":
+            picked = st.date_input("Dates", (today - timedelta(days=29), today), max_value=today, key="history_dates")
+            start_date, end_date = picked if isinstance(picked, (list, tuple)) and len(picked) == 2 else (today, today)
         else:
+            start_date, end_date = today - timedelta(days=HISTORY_RANGES[range_label] - 1), today
+        range_days = (end_date - start_date).days + 1
+        default_group = 0 if range_days <= 31 else 1 if range_days <= 120 else 2
+        with group_col:
+            granularity = st.selectbox(
+                "Group by", HISTORY_GRANULARITIES, index=default_group,
+                format_func=str.title, key=f"history_group_{default_group}"
+            )
+        periods = {"day": "Days", "week": "Weeks", "month": "Months"}[granularity]
+
+        history = DataManager.get_history(user_id, start_date, end_date, granularity)
+        df = DataManager.create_history_dataframe(history, daily_target, start_date, end_date, granularity)
+
+        if df.empty or df["Meals"].sum() == 0:
+            st.warning(f"No meal data available for {range_label.lower() if range_label != 'Custom' else 'these dates'}.")
+        else:
+            days_logged = int(df["Days Logged"].sum())
+            over_target = int((df["Calories"] > daily_target).sum())
+
             # Display metrics
             col1, col2, col3 = st.columns(3)
             with col1:
-                avg_calories = df["Calories"].mean()
+                avg_calories = df["Total Calories"].sum() / max(1, days_logged)
                 st.metric("Avg Daily Calories", f"{avg_calories:.0f} kcal")
             with col2:
-                over_target_days = (df["Calories"] > daily_target).sum()
-                st.metric("Days Over Target", f"{over_target_days}/7")
+                st.metric(f"{periods} Over Target", f"{over_target}/{len(df)}")
             with col3:
-                days_with_meals = (df["Meals"] > 0).sum()
-                st.metric("Active Days", f"{days_with_meals}/7")
+                st.metric("Active Days", f"{days_logged}/{range_days}")
 
             # Calories chart with different colors for over/under target
             st.subheader("Calories Consumption Trend")
+            if granularity != "day":
+                st.caption("Average calories per logged day in each period")
 
             # Create separate dataframes for over and under target
             over_target_df = df[df["Calories"] > daily_target]
@@ -724,7 +993,7 @@ def show_main_app():
             base = alt.Chart(df).encode(
                 x=alt.X("Date:T", title="Date", axis=alt.Axis(format="%b %d")),
                 y=alt.Y("Calories:Q", title="Calories Consumed"),
-                tooltip=["Day:N", "Calories:Q", "Status:N"]
+                tooltip=["Period:N", "Calories:Q", "Status:N"]
             )
 
             # Line connecting all points
@@ -734,14 +1003,14 @@ def show_main_app():
             under_points = alt.Chart(under_target_df).mark_circle(size=100, color="green").encode(
                 x="Date:T",
                 y="Calories:Q",
-                tooltip=["Day:N", "Calories:Q", alt.Tooltip("Status:N", title="Status")]
+                tooltip=["Period:N", "Calories:Q", alt.Tooltip("Status:N", title="Status")]
             )
 
             # Points for over target (red)
             over_points = alt.Chart(over_target_df).mark_circle(size=100, color="red").encode(
                 x="Date:T",
                 y="Calories:Q",
-                tooltip=["Day:N", "Calories:Q", alt.Tooltip("Status:N", title="Status")]
+                tooltip=["Period:N", "Calories:Q", alt.Tooltip("Status:N", title="Status")]
             )
 
             # Daily target line
@@ -771,46 +1040,46 @@ def show_main_app():
             # Data table with color coding
             st.subheader("Detailed Data")
             df_display = df.copy()
-            df_display["Date"] = df_display["Date"].dt.strftime("%Y-%m-%d (%A)")
-
-            def style_status(val):
-                if "Over Target" in str(val):
-                    return 'color: red; font-weight: bold'
-                else:
-                    return 'color: green'
+            if granularity == "day":
+                df_display["Date"] = df_display["Date"].dt.strftime("%Y-%m-%d (%A)")
+            else:
+                df_display["Date"] = df_display["Period"]
 
             # Display styled dataframe
-            styled_df = df_display[["Date", "Calories", "Meals"]].copy()
+            styled_df = df_display[["Date", "Calories", "Protein", "Carbs", "Fat", "Meals"]].copy()
             styled_df["Status"] = df_display["Calories"].apply(
                 lambda x: " Over Target" if x > daily_target else " On Target"
             )
 
             # Apply styling
             styled_df_display = styled_df.style.applymap(
-                lambda x: 'color: red; font-weight: bold' if '⚠️' in str(x) else 'color: green',
+                lambda x: 'color: red; font-weight: bold' if 'Over' in str(x) else 'color: green',
                 subset=['Status']
             )
 
             st.dataframe(styled_df_display, use_container_width=True)
 
             # Summary statistics
-            with st.expander(" Weekly Summary Statistics"):
-                total_cal_week = df["Calories"].sum()
-                avg_cal = df["Calories"].mean()
+            with st.expander(" Summary Statistics"):
+                total_cal = df["Total Calories"].sum()
                 max_cal = df["Calories"].max()
                 min_cal = df["Calories"].min()
-                days_over = (df["Calories"] > daily_target).sum()
 
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.metric("Total Week Calories", f"{total_cal_week:.0f} kcal")
-                    st.metric("Highest Day", f"{max_cal:.0f} kcal")
+                    st.metric("Total Calories", f"{total_cal:.0f} kcal")
+                    st.metric(f"Highest {periods[:-1]}", f"{max_cal:.0f} kcal")
                 with col2:
-                    st.metric("Average Daily", f"{avg_cal:.0f} kcal")
-                    st.metric("Lowest Day", f"{min_cal:.0f} kcal")
+                    st.metric("Average Daily", f"{avg_calories:.0f} kcal")
+                    st.metric(f"Lowest {periods[:-1]}", f"{min_cal:.0f} kcal")
                 with col3:
-                    st.metric("Target Compliance", f"{7-days_over}/7 days")
-                    st.metric("Over Target Days", f"{days_over} days")
+                    st.metric("Target Compliance", f"{len(df) - over_target}/{len(df)} {periods.lower()}")
+                    st.metric("Over Target", f"{over_target} {periods.lower()}")
+
+            show_macro_trends(df, daily_target, st.session_state["user"].get("goal"))
+
+        st.divider()
+        show_history_browser(user_id)
 
     # TAB 5 — LOGOUT
     with tab5:
@@ -859,6 +1128,14 @@ def show_main_app():
 # MAIN APP ROUTER
 def main():
     """Main application router"""
+    try:
+        ensure_indexes()
+    except Exception as e:
+        # Raised out of the cached function, so the next run tries again
+        print(f" Could not apply indexes: {e}")
+    if ANALYSIS_MODE == "background":
+        start_job_workers()
+
     if not st.session_state.logged_in:
         show_login_page()
     else:
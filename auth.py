@@ -2,29 +2,106 @@
 Authentication module
 """
 
+import os
+import re
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dotenv import load_dotenv
+from pymongo import UpdateOne
 from database import db
+from throttle import login_throttle
+from user_store import user_store
+
+load_dotenv()
+
+# bcrypt work factor for new hashes, older hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Concurrent bcrypt operations per process, bcrypt releases the GIL
+BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+BCRYPT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("BCRYPT_QUEUE_TIMEOUT_SECONDS", 10))
+
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt")
+
+
+class PasswordHashingBusyError(RuntimeError):
+    """Raised when a bcrypt operation could not finish before the queue timeout"""
+
+
+def _run_bcrypt(fn, *args):
+    """Run a bcrypt call on the bounded pool and wait for it"""
+    future = _bcrypt_pool.submit(fn, *args)
+    try:
+        return future.result(timeout=BCRYPT_QUEUE_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        future.cancel()
+        raise PasswordHashingBusyError("Too many sign-ins right now, please try again")
+
+
+def _log_rehash_failure(future):
+    """Done callback of background rehashes, which nobody waits for"""
+    error = future.exception() if not future.cancelled() else None
+    if error is not None:
+        print(f" Password rehash failed: {error}")
+
+
+def hash_rounds(hashed_password):
+    """Work factor of a bcrypt hash ($2b$12$...)"""
+    try:
+        return int(hashed_password.split(b"$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+# Shortest input that may match names by prefix during recovery
+RECOVERY_MIN_PREFIX = 3
+
+def normalize_name_key(name):
+    """Lowercased, whitespace-collapsed name stored as users.name_key"""
+    return " ".join(str(name or "").lower().split())
 
 class AuthManager:
     @staticmethod
     def hash_password(password):
-        """Hash password using bcrypt"""
-        return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+        """Hash password using bcrypt (on the bcrypt pool)"""
+        return _run_bcrypt(bcrypt.hashpw, password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))
     
     @staticmethod
     def check_password(password, hashed_password):
         """Verify password against hash"""
         if isinstance(hashed_password, str):
             hashed_password = hashed_password.encode()
-        return bcrypt.checkpw(password.encode(), hashed_password)
+        return _run_bcrypt(bcrypt.checkpw, password.encode(), hashed_password)
+    
+    @staticmethod
+    def _upgrade_hash(username, password, old_hash):
+        """Rehash at the current work factor, unless the password changed meanwhile"""
+        new_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))
+        db.users_col.update_one(
+            {"username": username, "password_hash": old_hash},
+            {"$set": {"password_hash": new_hash}}
+        )
     
-    def authenticate(self, username, password):
-        """Authenticate user"""
+    def authenticate(self, username, password, client=None):
+        """
+        Authenticate user.
+        Raises LoginThrottledError before touching the database or bcrypt
+        when the username or client has too many recent failures.
+        """
+        login_throttle.check(username, client)
         user = db.users_col.find_one({"username": username})
         if not user:
+            login_throttle.record_failure(username, client)
             return None
         if self.check_password(password, user["password_hash"]):
-            return user
+            login_throttle.record_success(username)
+            old_hash = user["password_hash"]
+            if hash_rounds(old_hash.encode() if isinstance(old_hash, str) else old_hash) < BCRYPT_ROUNDS:
+                # Upgrade in the background, the login doesn't wait for it
+                _bcrypt_pool.submit(self._upgrade_hash, username, password, old_hash).add_done_callback(
+                    _log_rehash_failure
+                )
+            # The session only ever sees the profile without the hash
+            return user_store.prime(user)
+        login_throttle.record_failure(username, client)
         return None
     
     def register_user(self, user_data):
@@ -36,6 +113,7 @@ class AuthManager:
                 return False, "Email already registered"
             
             # Insert user
+            user_data["name_key"] = normalize_name_key(user_data.get("name"))
             result = db.users_col.insert_one(user_data)
             return True, "Registration successful"
         except Exception as e:
@@ -43,29 +121,44 @@ class AuthManager:
     
     def recover_user_id(self, email_or_name):
         """Find user by email or name"""
+        projection = {"username": 1}
         if '@' in email_or_name:
-            user = db.users_col.find_one({"email": email_or_name})
+            user = db.users_col.find_one({"email": email_or_name.strip()}, projection)
         else:
-            user = db.users_col.find_one({"name": {"$regex": email_or_name, "$options": "i"}})
+            # Exact normalized name, then an anchored prefix; both stay on the name_key index
+            key = normalize_name_key(email_or_name)
+            if not key:
+                return None
+            user = db.users_col.find_one({"name_key": key}, projection)
+            if user is None and len(key) >= RECOVERY_MIN_PREFIX:
+                user = db.users_col.find_one({"name_key": {"$regex": f"^{re.escape(key)}"}}, projection)
         
         return user.get("username") if user else None
     
     def reset_password(self, username, new_password):
         """Reset user password"""
         hashed = self.hash_password(new_password)
-        result = db.users_col.update_one(
-            {"username": username},
-            {"$set": {"password_hash": hashed}}
-        )
-        return result.modified_count > 0
+        return user_store.update(username, {"password_hash": hashed})
     
     def update_user_profile(self, username, update_data):
         """Update user profile"""
-        result = db.users_col.update_one(
-            {"username": username},
-            {"$set": update_data}
-        )
-        return result.modified_count > 0
+        if "name" in update_data:
+            update_data = dict(update_data, name_key=normalize_name_key(update_data["name"]))
+        return user_store.update(username, update_data)
+
+    @staticmethod
+    def backfill_name_keys(batch_size=1000):
+        """Add name_key to users created before it existed"""
+        updated = 0
+        ops = []
+        for user in db.users_col.find({"name_key": {"$exists": False}}, {"name": 1}):
+            ops.append(UpdateOne({"_id": user["_id"]}, {"$set": {"name_key": normalize_name_key(user.get("name"))}}))
+            if len(ops) >= batch_size:
+                updated += db.users_col.bulk_write(ops, ordered=False).modified_count
+                ops = []
+        if ops:
+            updated += db.users_col.bulk_write(ops, ordered=False).modified_count
+        return updated
 
 # Global auth instance
 auth = AuthManager()
\ No newline at end of file
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark the columnar analytics engine against a per-user Python loop
+
+Usage:
+    python benchmarks/bench_analytics.py --users 10000 --days 365
+    python benchmarks/bench_analytics.py --from-db --days 90
+    python benchmarks/bench_analytics.py --seed-db --users 2000 --days 365
+
+Generates synthetic daily rollups (no MongoDB needed) unless --from-db
+is given, in which case the engine loads real food logs through cursor
+batches. --seed-db writes the synthetic rollups as bench_* food logs
+first, times loading them back and removes them afterwards (unless
+--keep). The loop baseline runs on a sample of users and is scaled up.
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db
+from utils import AnalyticsEngine
+
+BENCH_PREFIX = "bench_"
+
+
+def synthetic_frame(users, days, end_date, log_rate=0.8, seed=7):
+    rng = np.random.default_rng(seed)
+    user_idx = np.repeat(np.arange(users), days)
+    day_idx = np.tile(np.arange(days), users)
+    keep = rng.random(users * days) < log_rate
+    user_idx, day_idx = user_idx[keep], day_idx[keep]
+    start = pd.Timestamp(end_date - timedelta(days=days - 1))
+    rows = len(user_idx)
+    return pd.DataFrame({
+        "user_id": pd.Categorical.from_codes(user_idx, [f"user{i}" for i in range(users)]).astype(str),
+        "date": (start + pd.to_timedelta(day_idx, unit="D")).strftime("%Y-%m-%d"),
+        "calories": rng.normal(1900, 350, rows).clip(200).round(),
+        "protein": rng.normal(70, 20, rows).clip(0).round(1),
+        "carbs": rng.normal(240, 60, rows).clip(0).round(1),
+        "fat": rng.normal(65, 20, rows).clip(0).round(1),
+        "meals": rng.integers(1, 5, rows),
+    })
+
+
+def seed_food_logs(frame, chunk_size=5000):
+    """Insert the synthetic rollups as bench_* day logs with totals"""
+    records = frame.to_dict("records")
+    for offset in range(0, len(records), chunk_size):
+        db.food_logs_col.insert_many([{
+            "user_id": BENCH_PREFIX + row["user_id"],
+            "date": row["date"],
+            "meals": [],
+            "totals": {key: float(row[key]) if key != "meals" else int(row[key])
+                       for key in AnalyticsEngine.COLUMNS}
+        } for row in records[offset:offset + chunk_size]], ordered=False)
+
+
+def drop_seeded_logs():
+    return db.food_logs_col.delete_many({"user_id": {"$regex": f"^{BENCH_PREFIX}"}}).deleted_count
+
+
+def loop_summary(frame, targets, start_date, end_date):
+    """Reference implementation: one user and one day at a time"""
+    days = (end_date - start_date).days + 1
+    report = {}
+    for user_id, rows in frame.groupby("user_id"):
+        by_day = dict(zip(rows["date"], rows["calories"]))
+        series = []
+        logged_days = []
+        current = longest = compliant_days = 0
+        for offset in range(days):
+            key = (start_date + timedelta(days=offset)).isoformat()
+            calories = by_day.get(key, 0)
+            series.append(calories)
+            logged_days.append(key in by_day)
+            if key in by_day and calories <= targets.get(user_id, 2000):
+                current += 1
+                compliant_days += 1
+                longest = max(longest, current)
+            else:
+                current = 0
+        logged = max(len(by_day), 1)
+        report[user_id] = {
+            "avg_calories": sum(series) / logged,
+            "avg_7d": sum(series[-7:]) / max(sum(logged_days[-7:]), 1),
+            "avg_30d": sum(series[-30:]) / max(sum(logged_days[-30:]), 1),
+            "compliance": compliant_days / logged,
+            "current_streak": current,
+            "longest_streak": longest,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--baseline-users", type=int, default=200, help="Users timed with the Python loop")
+    parser.add_argument("--from-db", action="store_true", help="Load food logs from MongoDB instead")
+    parser.add_argument("--seed-db", action="store_true", help="Seed synthetic food logs and load them back")
+    parser.add_argument("--keep", action="store_true", help="Keep the seeded food logs")
+    args = parser.parse_args()
+
+    engine = AnalyticsEngine()
+    end_date = date.today()
+    start_date = end_date - timedelta(days=args.days - 1)
+
+    t_load = None
+    if args.seed_db:
+        drop_seeded_logs()
+        seed_food_logs(synthetic_frame(args.users, args.days, end_date))
+        user_ids = [f"{BENCH_PREFIX}user{i}" for i in range(args.users)]
+    if args.from_db or args.seed_db:
+        start = time.perf_counter()
+        frame = engine.load(start_date, end_date, user_ids if args.seed_db else None)
+        t_load = time.perf_counter() - start
+        if args.seed_db and not args.keep:
+            drop_seeded_logs()
+    else:
+        frame = synthetic_frame(args.users, args.days, end_date)
+    users = frame["user_id"].nunique()
+    targets = {user_id: 2000 for user_id in frame["user_id"].unique()}
+    print(f"\n {len(frame):,} day rows for {users:,} users over {args.days} days "
+          f"({'MongoDB' if t_load is not None else 'synthetic'})")
+
+    start = time.perf_counter()
+    summary = engine.summarize(frame, targets, start_date, end_date)
+    t_engine = time.perf_counter() - start
+
+    sample_ids = frame["user_id"].drop_duplicates().head(args.baseline_users)
+    sample = frame[frame["user_id"].isin(sample_ids)]
+    start = time.perf_counter()
+    baseline = loop_summary(sample, targets, start_date, end_date)
+    t_loop = (time.perf_counter() - start) * users / max(len(sample_ids), 1)
+
+    # Same answers on the sampled users
+    for user_id, expected in baseline.items():
+        got = summary.loc[user_id]
+        for key, value in expected.items():
+            assert abs(got[key] - value) < 1e-6, (user_id, key, got[key], value)
+
+    if t_load is not None:
+        print(f" Load from MongoDB:  {t_load:.2f}s ({len(frame) / max(t_load, 1e-9):,.0f} rows/s)")
+    else:
+        print(" Load from MongoDB:  not measured (synthetic frame, use --from-db or --seed-db)")
+    print(f" Vectorized engine:  {t_engine:.2f}s")
+    if t_load is not None:
+        print(f" Load + engine:      {t_load + t_engine:.2f}s")
+    print(f" Python loop (est.): {t_loop:.2f}s from {len(sample_ids)} users")
+    print(f" Speedup:            {t_loop / max(t_engine, 1e-9):.0f}x\n")
+    print(summary.describe().round(1).to_string())
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark image preprocessing: payload size and latency before/after
+
+Usage:
+    python benchmarks/bench_image_preprocessing.py [IMAGE_DIR] [--uplink-mbps 10]
+
+Without IMAGE_DIR a synthetic corpus of phone-sized photos is generated.
+End-to-end latency is the local CPU work plus the time to push the payload
+through an uplink of the given bandwidth.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from image_processing import ImagePreprocessor
+
+
+def make_synthetic_corpus(count=8):
+    """Generate 12 MP JPEGs with camera-like noise and EXIF rotation"""
+    corpus = []
+    for i in range(count):
+        width, height = (4032, 3024) if i % 2 == 0 else (3024, 4032)
+        noise = Image.effect_noise((width, height), 40 + i * 5).convert("RGB")
+        gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        img = Image.blend(noise, gradient, 0.5)
+        exif = Image.Exif()
+        exif[0x0112] = 6 if i % 3 == 0 else 1
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=95, exif=exif)
+        corpus.append((f"synthetic_{i}.jpg", buf.getvalue()))
+    return corpus
+
+
+def load_corpus(image_dir):
+    corpus = []
+    for path in sorted(Path(image_dir).iterdir()):
+        if path.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"):
+            corpus.append((path.name, path.read_bytes()))
+    return corpus
+
+
+def baseline(image_bytes):
+    """What the app did before: decode the full image and hand it to the SDK"""
+    img = Image.open(io.BytesIO(image_bytes))
+    img.load()
+    # The SDK re-encodes PIL images before upload
+    buf = io.BytesIO()
+    img.convert("RGB").save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def run(corpus, preprocessor, uplink_mbps):
+    bytes_per_second = uplink_mbps * 1e6 / 8
+    print(f"{'image':<22}{'orig KB':>10}{'before KB':>11}{'after KB':>10}"
+          f"{'before ms':>11}{'after ms':>10}")
+
+    totals = {"orig": 0, "before": 0, "after": 0, "before_ms": 0.0, "after_ms": 0.0}
+    for name, data in corpus:
+        start = time.perf_counter()
+        before_payload = baseline(data)
+        before_cpu = time.perf_counter() - start
+
+        start = time.perf_counter()
+        after_payload, _ = preprocessor.process(data)
+        after_cpu = time.perf_counter() - start
+
+        before_ms = (before_cpu + len(before_payload) / bytes_per_second) * 1000
+        after_ms = (after_cpu + len(after_payload) / bytes_per_second) * 1000
+
+        totals["orig"] += len(data)
+        totals["before"] += len(before_payload)
+        totals["after"] += len(after_payload)
+        totals["before_ms"] += before_ms
+        totals["after_ms"] += after_ms
+        print(f"{name[:21]:<22}{len(data) / 1024:>10.0f}{len(before_payload) / 1024:>11.0f}"
+              f"{len(after_payload) / 1024:>10.0f}{before_ms:>11.0f}{after_ms:>10.0f}")
+
+    n = len(corpus)
+    print("-" * 74)
+    print(f"{'mean':<22}{totals['orig'] / n / 1024:>10.0f}{totals['before'] / n / 1024:>11.0f}"
+          f"{totals['after'] / n / 1024:>10.0f}{totals['before_ms'] / n:>11.0f}{totals['after_ms'] / n:>10.0f}")
+    print(f"\n Payload reduction: {1 - totals['after'] / totals['before']:.1%}")
+    print(f" Latency reduction: {1 - totals['after_ms'] / totals['before_ms']:.1%}"
+          f" (uplink {uplink_mbps} Mbit/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir", nargs="?", help="Directory of sample meal photos")
+    parser.add_argument("--uplink-mbps", type=float, default=10.0)
+    parser.add_argument("--max-edge", type=int, default=None)
+    parser.add_argument("--format", default=None, choices=["JPEG", "WEBP"])
+    parser.add_argument("--quality", type=int, default=None)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.image_dir) if args.image_dir else make_synthetic_corpus()
+    if not corpus:
+        print(" No images found")
+        return
+
+    preprocessor = ImagePreprocessor(max_edge=args.max_edge, fmt=args.format, quality=args.quality)
+    print(f" {len(corpus)} images, preprocessor {preprocessor.config_key()}\n")
+    run(corpus, preprocessor, args.uplink_mbps)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Load test the upload -> save -> recommend path without the network
+
+Usage:
+    python benchmarks/bench_meal_pipeline.py --users 20 --meals 5 --latency-ms 800
+    python benchmarks/bench_meal_pipeline.py --backend replay --profile pipeline.prof
+
+Uses the deterministic stub backend by default and a local MongoDB.
+Benchmark users are named bench_user_<n> and their logs are removed
+afterwards unless --keep is given.
+"""
+
+import argparse
+import cProfile
+import io
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The global ai_service is built at import time, keep it off the network
+os.environ.setdefault("AI_BACKEND", "stub")
+
+from PIL import Image
+from ai_backends import StubBackend, create_backend
+from ai_services import AIServices
+from utils import DataManager
+from database import db
+
+
+def make_image(seed, size=(1600, 1200)):
+    img = Image.new("RGB", size, ((seed * 37) % 256, (seed * 91) % 256, (seed * 53) % 256))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def run_user(service, user_index, meals, unique_images):
+    user_doc = {
+        "username": f"bench_user_{user_index}",
+        "name": f"Bench User {user_index}",
+        "goal": "maintenance",
+        "dietary_preference": "Veg",
+        "daily_calorie_target": 2000,
+    }
+    timings = {"analyze": [], "save": [], "recommend": [], "total": []}
+    for meal in range(meals):
+        seed = user_index * meals + meal if unique_images else meal
+        image_bytes = make_image(seed)
+
+        start = time.perf_counter()
+        parsed = service.analyze_food_image(image_bytes)
+        t_analyze = time.perf_counter()
+        if "error" in parsed:
+            raise RuntimeError(parsed["error"])
+
+        DataManager.save_meal_log(user_doc["username"], "Lunch", parsed)
+        log_doc = DataManager.get_today_log(user_doc["username"])
+        t_save = time.perf_counter()
+
+        service.generate_recommendation(user_doc, log_doc)
+        t_done = time.perf_counter()
+
+        timings["analyze"].append(t_analyze - start)
+        timings["save"].append(t_save - t_analyze)
+        timings["recommend"].append(t_done - t_save)
+        timings["total"].append(t_done - start)
+    return timings
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="stub", choices=["stub", "replay", "gemini"])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--meals", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=500, help="Stub backend latency")
+    parser.add_argument("--repeat-images", action="store_true", help="Reuse images across users to exercise the cache")
+    parser.add_argument("--profile", metavar="FILE", help="Write cProfile stats to FILE")
+    parser.add_argument("--keep", action="store_true", help="Keep benchmark food logs")
+    args = parser.parse_args()
+
+    backend = StubBackend(latency_ms=args.latency_ms) if args.backend == "stub" else create_backend(args.backend)
+    service = AIServices(backend=backend)
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        futures = [
+            pool.submit(run_user, service, i, args.meals, not args.repeat_images)
+            for i in range(args.users)
+        ]
+        results = [f.result() for f in futures]
+    wall = time.perf_counter() - start
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f" Profile written to {args.profile}")
+
+    print(f"\n Backend: {backend.name} | users: {args.users} | meals/user: {args.meals}")
+    print(f" Wall time: {wall:.2f}s | throughput: {args.users * args.meals / wall:.1f} meals/s\n")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for stage in ("analyze", "save", "recommend", "total"):
+        values = [v for r in results for v in r[stage]]
+        print(f"{stage:<12}{percentile(values, 0.50) * 1000:>10.1f}{percentile(values, 0.95) * 1000:>10.1f}"
+              f"{percentile(values, 0.99) * 1000:>10.1f}{statistics.mean(values) * 1000:>10.1f}")
+
+    stats = service.get_cache_stats()
+    print(f"\n Analysis cache: {stats['analysis']}")
+    print(f" Recommendation cache: {stats['recommendation']}")
+
+    if not args.keep:
+        db.food_logs_col.delete_many({"user_id": {"$regex": "^bench_user_"}})
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,240 @@
+"""
+Caching helpers for AI analysis results
+"""
+
+import os
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with optional TTL"""
+
+    def __init__(self, max_size=256, ttl_seconds=None):
+        self.max_size = max(1, int(max_size))
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return cached value and mark it as recently used"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store value, evicting the least recently used entry when full"""
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove a key and return its value"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else default
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for food image analysis results.
+
+    Tier 1 is a bounded in-process LRU, tier 2 is a MongoDB collection
+    with a TTL index so entries expire on their own.
+    """
+
+    def __init__(self, max_size=None, ttl_days=None, collection_name="analysis_cache", persist=None):
+        self.max_size = int(max_size or os.getenv("ANALYSIS_CACHE_SIZE", 512))
+        self.ttl_days = float(ttl_days or os.getenv("ANALYSIS_CACHE_TTL_DAYS", 30))
+        if persist is None:
+            persist = os.getenv("ANALYSIS_CACHE_PERSIST", "1") not in ("0", "false", "False")
+        self.persist = persist
+        self.collection_name = collection_name
+
+        self.memory = LRUCache(self.max_size)
+        self._collection = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "errors": 0,
+            "saved_seconds": 0.0,
+        }
+
+    @staticmethod
+    def make_key(image_bytes, prompt, model_name, variant=""):
+        """Content address for an analysis: image bytes + prompt + model version"""
+        digest = hashlib.sha256()
+        for part in (model_name.encode(), variant.encode(), prompt.encode(), image_bytes):
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _get_collection(self):
+        """Lazily resolve the MongoDB collection and its TTL index"""
+        if not self.persist:
+            return None
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    from database import db
+                    from indexes import ensure_indexes
+                    col = db.db[self.collection_name]
+                    # Updates the TTL in place when ANALYSIS_CACHE_TTL_DAYS changes
+                    ensure_indexes(col, [
+                        {"keys": [("created_at", 1)], "expireAfterSeconds": int(self.ttl_days * 86400)}
+                    ])
+                    self._collection = col
+        return self._collection
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, key):
+        """Look up a cached analysis, returning a private copy or None"""
+        entry = self.memory.get(key)
+        if entry is not None:
+            self._count("memory_hits")
+            self._count("saved_seconds", entry.get("elapsed", 0.0))
+            return copy.deepcopy(entry["result"])
+
+        try:
+            col = self._get_collection()
+            if col is not None:
+                doc = col.find_one({"_id": key})
+                # The TTL monitor only runs once a minute, so double check expiry
+                if doc and doc["created_at"] > datetime.utcnow() - timedelta(days=self.ttl_days):
+                    entry = {"result": doc["result"], "elapsed": doc.get("elapsed", 0.0)}
+                    self.memory.set(key, entry)
+                    self._count("persistent_hits")
+                    self._count("saved_seconds", entry["elapsed"])
+                    return copy.deepcopy(entry["result"])
+        except Exception as e:
+            self._count("errors")
+            print(f" Analysis cache lookup failed: {e}")
+
+        self._count("misses")
+        return None
+
+    def set(self, key, result, elapsed=0.0):
+        """Store a successful analysis in both tiers"""
+        entry = {"result": copy.deepcopy(result), "elapsed": float(elapsed)}
+        self.memory.set(key, entry)
+        self._count("stores")
+
+        try:
+            col = self._get_collection()
+            if col is not None:
+                col.replace_one(
+                    {"_id": key},
+                    {"result": entry["result"], "elapsed": entry["elapsed"], "created_at": datetime.utcnow()},
+                    upsert=True
+                )
+        except Exception as e:
+            self._count("errors")
+            print(f" Analysis cache store failed: {e}")
+
+    def clear(self):
+        """Clear the in-process tier (persistent entries expire via TTL)"""
+        self.memory.clear()
+
+    def stats(self):
+        """Hit/miss counters plus the API time the cache has saved"""
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats["memory_hits"] + stats["persistent_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["saved_calls"] = hits
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+class RecommendationCache:
+    """
+    In-process cache of next meal recommendations keyed on a
+    normalized nutrition-state fingerprint, with TTL and LRU eviction.
+    """
+
+    def __init__(self, max_size=None, ttl_seconds=None, bucket_kcal=None):
+        self.max_size = int(max_size or os.getenv("RECOMMENDATION_CACHE_SIZE", 1024))
+        self.ttl_seconds = float(ttl_seconds or os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", 6 * 3600))
+        self.bucket_kcal = int(bucket_kcal or os.getenv("RECOMMENDATION_BUCKET_KCAL", 100))
+        self.memory = LRUCache(self.max_size, self.ttl_seconds)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0}
+
+    def bucket(self, remaining):
+        """Round remaining calories to the middle of their bucket"""
+        return int(remaining // self.bucket_kcal) * self.bucket_kcal + self.bucket_kcal // 2
+
+    def nutrition_state(self, user_doc, log_doc):
+        """The normalized inputs a recommendation depends on"""
+        meals = log_doc.get("meals", [])
+        target = int(user_doc.get("daily_calorie_target", 1500) or 0)
+        if "totals" in log_doc:
+            total_today = int(log_doc["totals"].get("calories", 0))
+        else:
+            total_today = sum(int(m.get("total_calories", 0) or 0) for m in meals)
+        return {
+            "goal": str(user_doc.get("goal") or "maintenance").strip().lower(),
+            "dietary_preference": str(user_doc.get("dietary_preference") or "none").strip().lower(),
+            "daily_calorie_target": target,
+            "remaining": self.bucket(target - total_today),
+            "meals": sorted(str(m.get("meal_name") or "Unknown").strip().title() for m in meals),
+        }
+
+    @staticmethod
+    def make_key(state, model_name):
+        payload = json.dumps([model_name, state], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        text = self.memory.get(key)
+        self._count("hits" if text is not None else "misses")
+        return text
+
+    def set(self, key, text):
+        self.memory.set(key, text)
+        self._count("stores")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(self.memory)
+        return stats
\ No newline at end of file
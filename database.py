@@ -3,77 +3,200 @@ Database connection for MongoDB Compass (localhost)
 """
 
 import os
-from pymongo import MongoClient
+import threading
+import time
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
 from gridfs import GridFS
 from dotenv import load_dotenv
+from cache import LRUCache
 
 load_dotenv()
 
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "nutrilens_db")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 2))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000))
+# zlib ships with Python, snappy/zstd need python-snappy/zstandard
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zlib")
+MONGO_CONNECT_RETRIES = int(os.getenv("MONGO_CONNECT_RETRIES", 3))
+MONGO_RETRY_BACKOFF_SECONDS = float(os.getenv("MONGO_RETRY_BACKOFF_SECONDS", 0.5))
+# User numbers reserved per round-trip, unused ones are skipped when the process exits
+USER_ID_BLOCK_SIZE = max(1, int(os.getenv("USER_ID_BLOCK_SIZE", 1)))
+PROFILE_THUMB_CACHE_SIZE = int(os.getenv("PROFILE_THUMB_CACHE_SIZE", 256))
+
 class Database:
+    """
+    Process-wide MongoDB handle.
+    Nothing connects at import time: the client is created on first use
+    and shared by every session through its connection pool. The backoff
+    only covers that first connection; afterwards the client is kept and
+    PyMongo's server monitoring and retryable reads/writes handle outages.
+    """
     def __init__(self):
         # Use local MongoDB from Compass
-        self.mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-        print(f" Connecting to: {self.mongo_uri}")
+        self.mongo_uri = MONGO_URI
+        self.db_name = MONGO_DB_NAME
+        
+        self._client = None
+        self._db = None
+        self._fs = None
+        self._lock = threading.Lock()
         
-        self.client = None
-        self.db = None
-        self.fs = None
-        self.users_col = None
-        self.food_logs_col = None
+        # Block of user numbers handed out from memory
+        self._id_lock = threading.Lock()
+        self._id_next = 0
+        self._id_end = 0
+        self._id_seeded = False
         
-        self._connect()
+        # Thumbnail bytes keyed by the original image's GridFS id
+        self._thumbnails = LRUCache(PROFILE_THUMB_CACHE_SIZE)
     
-    def _connect(self):
-        """Connect to local MongoDB"""
-        try:
-            # Simple connection to local MongoDB
-            self.client = MongoClient(
-                self.mongo_uri,
-                serverSelectionTimeoutMS=5000,
-                connectTimeoutMS=10000
-            )
-            
-            # Test connection
-            self.client.admin.command('ping')
-            print(" MongoDB connected successfully!")
-            
-            # Use our database
-            self.db = self.client["nutrilens_db"]
-            print(f" Database: {self.db.name}")
-            
-            # Setup GridFS for images
-            self.fs = GridFS(self.db)
-            
-            # Get collections
-            self.users_col = self.db["users"]
-            self.food_logs_col = self.db["food_logs"]
-            
-            print(f" Users collection: Ready")
-            print(f" Food logs collection: Ready")
+    def _create_client(self):
+        """Build a pooled client (connections are opened lazily by PyMongo)"""
+        options = {
+            "serverSelectionTimeoutMS": 5000,
+            "connectTimeoutMS": 10000,
+            "maxPoolSize": MONGO_MAX_POOL_SIZE,
+            "minPoolSize": MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+            "retryWrites": True,
+            "retryReads": True,
+            "appname": "nutrilens"
+        }
+        if MONGO_COMPRESSORS:
+            options["compressors"] = MONGO_COMPRESSORS
+        return MongoClient(self.mongo_uri, **options)
+    
+    def connect(self):
+        """Connect to MongoDB if not connected yet, retrying with backoff"""
+        if self._db is not None:
+            return self._db
+        
+        with self._lock:
+            if self._db is not None:
+                return self._db
             
-        except Exception as e:
-            print(f" MongoDB connection failed: {e}")
-            print("\n Please run: python setup_database.py first!")
-            raise
+            print(f" Connecting to: {self.mongo_uri}")
+            delay = MONGO_RETRY_BACKOFF_SECONDS
+            for attempt in range(1, MONGO_CONNECT_RETRIES + 1):
+                client = self._create_client()
+                try:
+                    # Test connection
+                    client.admin.command('ping')
+                except PyMongoError as e:
+                    client.close()
+                    print(f" MongoDB connection failed (attempt {attempt}/{MONGO_CONNECT_RETRIES}): {e}")
+                    if attempt == MONGO_CONNECT_RETRIES:
+                        print("\n Please run: python setup_database.py first!")
+                        raise
+                    time.sleep(delay)
+                    delay *= 2
+                    continue
+                
+                self._client = client
+                self._fs = GridFS(client[self.db_name])
+                self._db = client[self.db_name]
+                print(f" MongoDB connected successfully! Database: {self.db_name}")
+                return self._db
     
-    def get_next_user_id(self):
-        """Get next auto-incrementing user ID"""
+    @property
+    def client(self):
+        self.connect()
+        return self._client
+    
+    @property
+    def db(self):
+        return self.connect()
+    
+    @property
+    def fs(self):
+        """GridFS for images"""
+        self.connect()
+        return self._fs
+    
+    @property
+    def users_col(self):
+        return self.db["users"]
+    
+    @property
+    def food_logs_col(self):
+        return self.db["food_logs"]
+    
+    @property
+    def meals_col(self):
+        """One document per meal when MEAL_STORAGE is per_meal"""
+        return self.db["meals"]
+    
+    @property
+    def counters_col(self):
+        return self.db["counters"]
+    
+    def _seed_user_counter(self):
+        """Start the user counter after the highest existing user number"""
+        if self.counters_col.find_one({"_id": "user_id"}) is not None:
+            return
+        last_user = self.users_col.find_one(
+            {"user_id_number": {"$exists": True}},
+            {"user_id_number": 1},
+            sort=[("user_id_number", -1)]
+        )
+        seq = last_user["user_id_number"] if last_user else 0
         try:
-            last_user = self.users_col.find_one(
-                sort=[("user_id_number", -1)]
-            )
-            if last_user and "user_id_number" in last_user:
-                return last_user["user_id_number"] + 1
-            return 1
-        except:
-            return 1
+            self.counters_col.update_one({"_id": "user_id"}, {"$setOnInsert": {"seq": seq}}, upsert=True)
+        except DuplicateKeyError:
+            # Another process seeded it first
+            pass
+    
+    def allocate_user_ids(self, count=1):
+        """Atomically reserve `count` user numbers, returns the first one"""
+        if not self._id_seeded:
+            self._seed_user_counter()
+            self._id_seeded = True
+        counter = self.counters_col.find_one_and_update(
+            {"_id": "user_id"},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"] - count + 1
+    
+    def get_next_user_id(self):
+        """Get next auto-incrementing user ID (unique across processes)"""
+        with self._id_lock:
+            if self._id_next >= self._id_end:
+                self._id_next = self.allocate_user_ids(USER_ID_BLOCK_SIZE)
+                self._id_end = self._id_next + USER_ID_BLOCK_SIZE
+            number = self._id_next
+            self._id_next += 1
+        return number
+    
+    def _save_thumbnail(self, user_id, fs_id, image_bytes):
+        """Store a small JPEG of a profile image, linked by metadata.original_id"""
+        from image_processing import thumbnail_preprocessor
+        
+        thumb_bytes, _ = thumbnail_preprocessor.process(image_bytes)
+        self.fs.put(
+            thumb_bytes,
+            filename=f"{user_id}_profile_thumb.jpg",
+            metadata={"user_id": user_id, "kind": "profile_thumbnail", "original_id": fs_id}
+        )
+        self._thumbnails.set(fs_id, thumb_bytes)
+        return thumb_bytes
+    
+    def _delete_thumbnails(self, fs_id):
+        for thumb in self.fs.find({"metadata.original_id": fs_id}):
+            self.fs.delete(thumb._id)
+        self._thumbnails.pop(fs_id)
     
     def save_profile_image(self, user_id, image_bytes):
-        """Save profile image to GridFS"""
+        """Save profile image and its thumbnail to GridFS"""
         try:
             # Remove old image if exists
             old_file = self.fs.find_one({"filename": f"{user_id}_profile.png"})
             if old_file:
+                self._delete_thumbnails(old_file._id)
                 self.fs.delete(old_file._id)
             
             # Save new image
@@ -82,10 +205,16 @@ class Database:
                 filename=f"{user_id}_profile.png",
                 metadata={"user_id": user_id}
             )
-            return fs_id
         except Exception as e:
             print(f" Could not save image: {e}")
             return None
+        
+        try:
+            self._save_thumbnail(user_id, fs_id, image_bytes)
+        except Exception as e:
+            # The original is kept, get_profile_thumbnail retries later
+            print(f" Could not create thumbnail: {e}")
+        return fs_id
     
     def get_profile_image(self, fs_id):
         """Get profile image from GridFS"""
@@ -94,13 +223,39 @@ class Database:
         except:
             return None
     
+    def get_profile_thumbnail(self, fs_id):
+        """
+        Thumbnail bytes for a profile image, served from memory after the
+        first read. Images saved before thumbnails existed get one now.
+        """
+        thumb_bytes = self._thumbnails.get(fs_id)
+        if thumb_bytes is not None:
+            return thumb_bytes
+        try:
+            thumb = self.fs.find_one({"metadata.original_id": fs_id})
+            if thumb is not None:
+                thumb_bytes = thumb.read()
+                self._thumbnails.set(fs_id, thumb_bytes)
+                return thumb_bytes
+            
+            original = self.fs.get(fs_id)
+            user_id = (original.metadata or {}).get("user_id", "")
+            return self._save_thumbnail(user_id, fs_id, original.read())
+        except Exception:
+            return None
+    
     def delete_profile_image(self, fs_id):
-        """Delete profile image"""
+        """Delete profile image and its thumbnail"""
         try:
+            self._delete_thumbnails(fs_id)
             self.fs.delete(fs_id)
             return True
         except:
             return False
 
-# Global database instance
-db = Database()
\ No newline at end of file
+# Global database instance (connects on first query)
+db = Database()
+
+def get_database():
+    """Shared Database handle, for st.cache_resource in the app"""
+    return db
\ No newline at end of file
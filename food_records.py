@@ -0,0 +1,160 @@
+"""
+Typed records and parsing for food analysis results
+"""
+
+import re
+from dataclasses import dataclass, field
+
+# Schema for Gemini structured output (JSON mime type)
+FOOD_ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "foods": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "item": {"type": "STRING"},
+                    "quantity": {"type": "STRING"},
+                    "calories": {"type": "NUMBER"},
+                    "protein": {"type": "NUMBER"},
+                    "fat": {"type": "NUMBER"},
+                    "carbs": {"type": "NUMBER"},
+                    "nutrients": {"type": "ARRAY", "items": {"type": "STRING"}}
+                },
+                "required": ["item", "quantity", "calories"]
+            }
+        },
+        "total_calories": {"type": "NUMBER"}
+    },
+    "required": ["foods", "total_calories"]
+}
+
+# Leading number of strings like "120 kcal", "~4g" or "1,200"
+_NUMBER = re.compile(r"\s*[~≈]?\s*(-?\d[\d,]*(?:\.\d+)?)")
+
+
+class AnalysisValidationError(ValueError):
+    """Raised when a model response does not match the analysis structure"""
+
+
+def extract_json_object(text):
+    """
+    Return the first balanced top-level {...} in text, or None.
+    Single pass, aware of strings and escapes, so trailing text is ignored.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    return None
+
+
+def to_number(value):
+    """Coerce a model-provided number once; None when absent or unparseable"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        match = _NUMBER.match(str(value))
+        if not match:
+            return None
+        number = float(match.group(1).replace(",", ""))
+    if number < 0:
+        return None
+    return int(number) if number.is_integer() else round(number, 1)
+
+
+@dataclass(slots=True)
+class FoodItem:
+    item: str
+    quantity: str
+    calories: float
+    protein: float = None
+    fat: float = None
+    carbs: float = None
+    nutrients: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise AnalysisValidationError("Food entry is not an object")
+        name = str(data.get("item") or "").strip()
+        if not name:
+            raise AnalysisValidationError("Food entry has no item name")
+        nutrients = data.get("nutrients") or []
+        if not isinstance(nutrients, list):
+            nutrients = [nutrients]
+        return cls(
+            item=name,
+            quantity=str(data.get("quantity") or "N/A").strip(),
+            calories=to_number(data.get("calories")),
+            protein=to_number(data.get("protein")),
+            fat=to_number(data.get("fat")),
+            carbs=to_number(data.get("carbs")),
+            nutrients=[str(n) for n in nutrients]
+        )
+
+    def to_dict(self):
+        return {
+            "item": self.item,
+            "quantity": self.quantity,
+            "calories": self.calories or 0,
+            "protein": self.protein or 0,
+            "fat": self.fat or 0,
+            "carbs": self.carbs or 0,
+            "nutrients": list(self.nutrients)
+        }
+
+
+@dataclass(slots=True)
+class FoodAnalysis:
+    foods: list
+    total_calories: float
+
+    @classmethod
+    def from_dict(cls, data, enrich=None):
+        """
+        Validate a parsed response. enrich(foods) may fill in
+        missing numbers before the total is derived.
+        """
+        if not isinstance(data, dict):
+            raise AnalysisValidationError("Analysis is not an object")
+        raw_foods = data.get("foods")
+        if not isinstance(raw_foods, list):
+            raise AnalysisValidationError("Analysis has no foods list")
+        foods = [FoodItem.from_dict(food) for food in raw_foods]
+        if enrich is not None:
+            enrich(foods)
+
+        total = to_number(data.get("total_calories"))
+        if total is None:
+            total = sum(food.calories or 0 for food in foods)
+        return cls(foods=foods, total_calories=total)
+
+    def to_dict(self):
+        return {
+            "foods": [food.to_dict() for food in self.foods],
+            "total_calories": self.total_calories
+        }
\ No newline at end of file
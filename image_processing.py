@@ -0,0 +1,141 @@
+"""
+Image preprocessing before sending meal photos to Gemini
+"""
+
+import io
+import os
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", 1024))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 85))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 50_000_000))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 25 * 1024 * 1024))
+PROFILE_THUMB_SIZE = int(os.getenv("PROFILE_THUMB_SIZE", 256))
+PROFILE_THUMB_QUALITY = int(os.getenv("PROFILE_THUMB_QUALITY", 80))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# JPEG segments dropped from passed-through uploads, so GPS position and
+# camera details are never sent: APP1 (EXIF, XMP), APP13 (IPTC), comments
+JPEG_METADATA_MARKERS = (0xE1, 0xED, 0xFE)
+
+
+class ImageRejectedError(ValueError):
+    """Raised when an upload is too large or not a decodable image"""
+
+
+def strip_jpeg_metadata(data):
+    """
+    JPEG bytes without metadata segments, compressed image data untouched.
+    Returns None if the segment layout is not understood.
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+    out = [data[:2]]
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker == 0xDA:
+            # Start of scan: the rest is entropy-coded image data
+            out.append(data[pos:])
+            return b"".join(out)
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        if length < 2:
+            return None
+        if marker not in JPEG_METADATA_MARKERS:
+            out.append(data[pos:pos + 2 + length])
+        pos += 2 + length
+    return None
+
+
+class ImagePreprocessor:
+    """
+    Normalize uploads: fix EXIF orientation, downscale to a max edge
+    and re-encode at a fixed quality. No upload metadata is sent on.
+    """
+
+    def __init__(self, max_edge=None, fmt=None, quality=None, max_pixels=None, max_bytes=None):
+        self.max_edge = int(max_edge or IMAGE_MAX_EDGE)
+        self.format = (fmt or IMAGE_FORMAT).upper()
+        self.quality = int(quality or IMAGE_QUALITY)
+        self.max_pixels = int(max_pixels or IMAGE_MAX_PIXELS)
+        self.max_bytes = int(max_bytes or IMAGE_MAX_BYTES)
+        if self.format not in ("JPEG", "WEBP"):
+            raise ValueError(f"Unsupported IMAGE_FORMAT: {self.format}")
+
+    def config_key(self):
+        """Identify the output of this preprocessor for cache keys"""
+        return f"{self.max_edge}:{self.format}:{self.quality}"
+
+    def process(self, image_bytes):
+        """
+        Preprocess raw upload bytes.
+        Returns (image_bytes, mime_type) ready for upload.
+        """
+        if len(image_bytes) > self.max_bytes:
+            raise ImageRejectedError(
+                f"Image is {len(image_bytes) / 1e6:.1f} MB, limit is {self.max_bytes / 1e6:.0f} MB"
+            )
+
+        try:
+            # Image.open only parses the header, so size checks happen before decoding
+            img = Image.open(io.BytesIO(image_bytes))
+            width, height = img.size
+            if width * height > self.max_pixels:
+                raise ImageRejectedError(
+                    f"Image is {width}x{height} pixels, limit is {self.max_pixels} pixels"
+                )
+
+            source_format = img.format
+            orientation = img.getexif().get(0x0112, 1)
+            needs_resize = max(width, height) > self.max_edge
+
+            # Already small, upright and compressed: send as-is, minus metadata
+            if not needs_resize and orientation == 1:
+                if source_format == "JPEG":
+                    stripped = strip_jpeg_metadata(image_bytes)
+                    if stripped is not None:
+                        return stripped, MIME_TYPES["JPEG"]
+                elif source_format == "WEBP" and not ({"exif", "xmp"} & set(img.info)):
+                    return image_bytes, MIME_TYPES["WEBP"]
+
+            # Let the JPEG decoder scale down by DCT while decoding
+            if needs_resize and source_format == "JPEG":
+                img.draft("RGB", (self.max_edge, self.max_edge))
+
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            if max(img.size) > self.max_edge:
+                img.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+
+            out = io.BytesIO()
+            if self.format == "JPEG":
+                img.save(out, format="JPEG", quality=self.quality, optimize=True, progressive=True)
+            else:
+                img.save(out, format="WEBP", quality=self.quality, method=4)
+        except ImageRejectedError:
+            raise
+        except Image.DecompressionBombError as e:
+            raise ImageRejectedError(str(e))
+        except Exception as e:
+            raise ImageRejectedError(f"Could not read image: {e}")
+
+        return out.getvalue(), MIME_TYPES[self.format]
+
+
+# Global preprocessor instance
+image_preprocessor = ImagePreprocessor()
+
+# Profile image thumbnails, generated once at upload time
+thumbnail_preprocessor = ImagePreprocessor(max_edge=PROFILE_THUMB_SIZE, fmt="JPEG", quality=PROFILE_THUMB_QUALITY)
\ No newline at end of file
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Bulk import historical meals into the daily food logs
+
+Usage:
+    python import_meals.py history.json
+    python import_meals.py history.csv --user alice_1234 --chunk-size 2000
+
+JSON input is either an array of meal objects or one object per line.
+CSV input has one meal per row with the columns
+user_id, date, meal_name, time, total_calories, protein, carbs, fat, notes
+and an optional foods column holding the foods list as JSON.
+Meals for the same user and day are appended in one upsert and the
+writes go out as unordered bulk_write chunks. Importing the same file
+twice adds the meals twice.
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+
+from utils import DataManager
+
+
+def read_json(path):
+    with open(path, encoding="utf-8") as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from json.load(f)
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            foods = json.loads(row["foods"]) if row.get("foods") else [{
+                "item": row.get("meal_name") or "Meal",
+                "quantity": "1 serving",
+                "calories": row.get("total_calories"),
+                "protein": row.get("protein"),
+                "carbs": row.get("carbs"),
+                "fat": row.get("fat"),
+                "nutrients": []
+            }]
+            yield {
+                "user_id": row.get("user_id"),
+                "date": row["date"],
+                "meal_name": row.get("meal_name") or "Meal",
+                "time": row.get("time"),
+                "foods": foods,
+                "total_calories": row.get("total_calories"),
+                "notes": row.get("notes", "")
+            }
+
+
+def with_user(records, user_id):
+    for record in records:
+        if user_id:
+            record["user_id"] = user_id
+        if not record.get("user_id"):
+            raise ValueError(f"Meal on {record.get('date')} has no user_id, pass --user")
+        yield record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="JSON, JSON Lines or CSV file")
+    parser.add_argument("--format", choices=["json", "csv"], help="Defaults to the file extension")
+    parser.add_argument("--user", help="Import every meal for this user_id")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Day documents per bulk_write")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "json")
+    records = read_csv(args.path) if fmt == "csv" else read_json(args.path)
+
+    start = time.perf_counter()
+    try:
+        meals, days = DataManager.bulk_import_meals(with_user(records, args.user), args.chunk_size)
+    except (ValueError, KeyError) as e:
+        print(f" Import failed: {e}")
+        sys.exit(1)
+
+    elapsed = time.perf_counter() - start
+    print(f" Imported {meals} meals into {days} day upserts in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
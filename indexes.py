@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Declarative MongoDB index registry
+
+Every index the app relies on is declared here and applied idempotently
+at startup (and by setup_database.py). Check mode explains the hot
+queries and reports any that still need a collection scan.
+
+Usage:
+    python indexes.py            # apply indexes
+    python indexes.py --check    # explain hot queries, report COLLSCANs
+    python indexes.py --merge-duplicates   # fold duplicate day logs, then apply
+"""
+
+import sys
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+# collection -> index specs: keys plus create_index options
+INDEXES = {
+    "users": [
+        {"keys": [("username", ASCENDING)], "unique": True},
+        {"keys": [("email", ASCENDING)], "unique": True},
+        {"keys": [("user_id_number", DESCENDING)]},
+        # Account recovery: exact and anchored-prefix matches on the normalized name
+        {"keys": [("name_key", ASCENDING)]},
+    ],
+    "food_logs": [
+        # One document per user and day, the atomic meal upsert relies on it
+        {"keys": [("user_id", ASCENDING), ("date", ASCENDING)], "unique": True},
+    ],
+    "meals": [
+        {"keys": [("u", ASCENDING), ("d", ASCENDING), ("t", ASCENDING)]},
+    ],
+    "fs.files": [
+        {"keys": [("filename", ASCENDING), ("uploadDate", ASCENDING)]},
+        {"keys": [("metadata.original_id", ASCENDING)], "sparse": True},
+    ],
+    "login_throttle": [
+        {"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+    ],
+    "analysis_jobs": [
+        {"keys": [("status", ASCENDING), ("created_at", ASCENDING)]},
+        {"keys": [("user_id", ASCENDING), ("created_at", DESCENDING)]},
+        {"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+    ],
+}
+
+# Options compared against existing indexes
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+# label -> (collection, filter, sort) of queries the app runs on every request
+HOT_QUERIES = {
+    "login by username": ("users", {"username": "user1"}, None),
+    "register email check": ("users", {"email": "user@example.com"}, None),
+    "recovery by name": ("users", {"name_key": {"$regex": "^jane d"}}, None),
+    "user counter seed": ("users", {"user_id_number": {"$exists": True}}, [("user_id_number", DESCENDING)]),
+    "today's food log": ("food_logs", {"user_id": "user1", "date": "2024-01-01"}, None),
+    "history range": ("food_logs", {"user_id": "user1", "date": {"$gte": "2024-01-01", "$lte": "2024-12-31"}}, None),
+    "history page": ("food_logs", {"user_id": "user1", "date": {"$lt": "2024-12-31"}}, [("date", DESCENDING)]),
+    "meals of a day": ("meals", {"u": "user1", "d": {"$in": ["2024-01-01", "2024-01-02"]}}, [("d", ASCENDING), ("t", ASCENDING)]),
+    "profile image by filename": ("fs.files", {"filename": "user1_profile.png"}, None),
+    "profile thumbnail": ("fs.files", {"metadata.original_id": "000000000000000000000000"}, None),
+    "job claim": ("analysis_jobs", {"status": "queued"}, [("created_at", ASCENDING)]),
+}
+
+
+def _normalize_keys(keys):
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+            for field, direction in keys]
+
+
+def _duplicate_groups(col, keys):
+    """Number of key values held by more than one document"""
+    group_id = {f"k{i}": f"${field}" for i, (field, _) in enumerate(keys)}
+    pipeline = [
+        {"$group": {"_id": group_id, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+        {"$count": "groups"}
+    ]
+    result = list(col.aggregate(pipeline, allowDiskUse=True))
+    return result[0]["groups"] if result else 0
+
+
+def ensure_indexes(col, specs):
+    """
+    Create the given index specs on one collection.
+    Returns a list of (index name, status) with status one of
+    "exists", "created", "rebuilt", "ttl updated" or an error message.
+    """
+    existing = {
+        tuple(_normalize_keys(info["key"])): (name, info)
+        for name, info in col.index_information().items()
+    }
+    report = []
+    for spec in specs:
+        keys = _normalize_keys(spec["keys"])
+        options = {key: value for key, value in spec.items() if key != "keys"}
+        name, info = existing.get(tuple(keys), (None, None))
+
+        if info is not None:
+            if all(info.get(option) == options.get(option) for option in INDEX_OPTIONS):
+                report.append((name, "exists"))
+                continue
+            changed = [option for option in INDEX_OPTIONS if info.get(option) != options.get(option)]
+            if changed == ["expireAfterSeconds"] and info.get("expireAfterSeconds") is not None \
+                    and options.get("expireAfterSeconds") is not None:
+                # A new TTL is changed in place, no rebuild needed
+                col.database.command("collMod", col.name, index={
+                    "name": name, "expireAfterSeconds": options["expireAfterSeconds"]
+                })
+                report.append((name, "ttl updated"))
+                continue
+            # Same keys, different options: only rebuild when the new one can be built
+            if options.get("unique"):
+                duplicates = _duplicate_groups(col, keys)
+                if duplicates:
+                    report.append((name, f"kept, {duplicates} duplicate key values block a unique index "
+                                         "(run python indexes.py --merge-duplicates)"))
+                    continue
+            col.drop_index(name)
+
+        try:
+            created = col.create_index(keys, **options)
+            report.append((created, "rebuilt" if info is not None else "created"))
+        except OperationFailure as e:
+            report.append((name or str(keys), f"failed: {e.details.get('errmsg', e) if e.details else e}"))
+    return report
+
+
+def apply_indexes(database=None, collections=None):
+    """Apply the registry, returns {collection: report}"""
+    if database is None:
+        from database import db
+        database = db.db
+    results = {}
+    for name, specs in INDEXES.items():
+        if collections is None or name in collections:
+            results[name] = ensure_indexes(database[name], specs)
+    return results
+
+
+def _plan_stages(plan):
+    """All stage names in an explain plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def check_queries(database=None):
+    """Explain each hot query, returns {label: (stages, uses collection scan)}"""
+    if database is None:
+        from database import db
+        database = db.db
+    results = {}
+    for label, (collection, query, sort) in HOT_QUERIES.items():
+        cursor = database[collection].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(winning)
+        results[label] = (stages, "COLLSCAN" in stages)
+    return results
+
+
+def main():
+    if "--check" in sys.argv[1:]:
+        results = check_queries()
+        scans = [label for label, (_, collscan) in results.items() if collscan]
+        for label, (stages, collscan) in results.items():
+            print(f" {'COLLSCAN' if collscan else 'ok':<9}{label:<28}{' > '.join(stages)}")
+        print(f"\n {len(scans)} of {len(results)} hot queries use a collection scan")
+        sys.exit(1 if scans else 0)
+
+    if "--merge-duplicates" in sys.argv[1:]:
+        from utils import DataManager
+        merged = DataManager.merge_duplicate_day_logs()
+        print(f" Merged {merged} duplicate day logs")
+
+    for collection, report in apply_indexes().items():
+        for name, status in report:
+            print(f" {collection}.{name}: {status}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,249 @@
+"""
+Background meal analysis jobs backed by MongoDB
+
+Submitting a meal stores its images in GridFS and enqueues a job.
+Worker threads claim jobs atomically, run the analysis, save the meal
+log and the next-meal recommendation on the job for the UI to poll.
+
+Run standalone workers with: python jobs.py --workers 4
+"""
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from pymongo import ASCENDING, ReturnDocument
+
+from database import db
+from indexes import INDEXES, ensure_indexes
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1.0))
+JOB_TTL_DAYS = float(os.getenv("JOB_TTL_DAYS", 7))
+# "background" queues uploads for workers, "inline" analyzes in the request
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "background")
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobQueue:
+    def __init__(self, collection_name="analysis_jobs"):
+        self.collection_name = collection_name
+        self._col = None
+        self._lock = threading.Lock()
+
+    @property
+    def col(self):
+        """Jobs collection, indexes are created on first use"""
+        if self._col is None:
+            with self._lock:
+                if self._col is None:
+                    col = db.db[self.collection_name]
+                    ensure_indexes(col, INDEXES["analysis_jobs"])
+                    self._col = col
+        return self._col
+
+    def submit(self, user_id, meal_type, images, notes=""):
+        """Store images and enqueue a job, returns the job id"""
+        image_ids = [
+            db.fs.put(image_bytes, metadata={"user_id": user_id, "kind": "meal_job_image"})
+            for image_bytes in images
+        ]
+        now = datetime.utcnow()
+        result = self.col.insert_one({
+            "user_id": user_id,
+            "meal_type": meal_type,
+            "notes": notes,
+            "image_ids": image_ids,
+            "status": STATUS_QUEUED,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now
+        })
+        return result.inserted_id
+
+    def claim(self, worker_id):
+        """Atomically take the oldest queued (or abandoned) job"""
+        now = datetime.utcnow()
+        return self.col.find_one_and_update(
+            {
+                "$or": [
+                    {"status": STATUS_QUEUED},
+                    {"status": STATUS_RUNNING, "lease_expires": {"$lt": now}}
+                ],
+                "attempts": {"$lt": JOB_MAX_ATTEMPTS}
+            },
+            {
+                "$set": {
+                    "status": STATUS_RUNNING,
+                    "worker": worker_id,
+                    "lease_expires": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def complete(self, job, result):
+        """Mark a job done and drop its images"""
+        self.finish(job, {"status": STATUS_DONE, "result": result})
+
+    def release(self, job):
+        """Return a claimed job to the queue without counting the attempt"""
+        self.col.update_one(
+            {"_id": job["_id"], "worker": job.get("worker")},
+            {"$set": {"status": STATUS_QUEUED, "updated_at": datetime.utcnow()}, "$inc": {"attempts": -1}}
+        )
+
+    def fail(self, job, error):
+        """Requeue a job, or fail it once attempts are used up"""
+        if job.get("attempts", 0) < JOB_MAX_ATTEMPTS:
+            self.col.update_one(
+                {"_id": job["_id"], "worker": job.get("worker")},
+                {"$set": {"status": STATUS_QUEUED, "error": error, "updated_at": datetime.utcnow()}}
+            )
+        else:
+            self.finish(job, {"status": STATUS_FAILED, "error": error})
+
+    def finish(self, job, fields):
+        """Write a final status and drop the job's images"""
+        now = datetime.utcnow()
+        fields.update({"updated_at": now, "expires_at": now + timedelta(days=JOB_TTL_DAYS)})
+        self.col.update_one({"_id": job["_id"]}, {"$set": fields, "$unset": {"lease_expires": ""}})
+        for image_id in job.get("image_ids", []):
+            try:
+                db.fs.delete(image_id)
+            except Exception:
+                pass
+
+    def reap_expired(self):
+        """Fail running jobs whose lease expired on their last attempt"""
+        now = datetime.utcnow()
+        for job in self.col.find(
+            {"status": STATUS_RUNNING, "lease_expires": {"$lt": now}, "attempts": {"$gte": JOB_MAX_ATTEMPTS}}
+        ):
+            self.finish(job, {"status": STATUS_FAILED, "error": "Analysis timed out"})
+
+    def get_jobs(self, job_ids):
+        """Fetch job status for the UI, in the given order"""
+        docs = self.col.find(
+            {"_id": {"$in": list(job_ids)}},
+            {"status": 1, "meal_type": 1, "result": 1, "error": 1, "created_at": 1}
+        )
+        by_id = {doc["_id"]: doc for doc in docs}
+        return [by_id[job_id] for job_id in job_ids if job_id in by_id]
+
+
+class JobWorkerPool:
+    """Worker threads that process analysis jobs"""
+
+    def __init__(self, queue, workers=None):
+        self.queue = queue
+        self.workers = JOB_WORKERS if workers is None else workers
+        self._stop = threading.Event()
+        self._threads = []
+        self._host = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(f"{self._host}:{i}",), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.workers:
+            print(f" Started {self.workers} analysis workers")
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self, worker_id):
+        while not self._stop.is_set():
+            job = None
+            try:
+                job = self.queue.claim(worker_id)
+                if job is None:
+                    self.queue.reap_expired()
+                    self._stop.wait(JOB_POLL_SECONDS)
+                    continue
+                self.process(job)
+            except Exception as e:
+                print(f" Job worker {worker_id} error: {e}")
+                if job is not None:
+                    # Requeue now instead of showing "analyzing" until the lease runs out
+                    try:
+                        self.queue.fail(job, str(e))
+                    except Exception as fail_error:
+                        print(f" Job worker {worker_id} could not fail job {job['_id']}: {fail_error}")
+                self._stop.wait(JOB_POLL_SECONDS)
+
+    def process(self, job):
+        # Imported here so the queue can be used without loading the AI stack
+        from ai_services import ai_service
+        from utils import DataManager
+        from user_store import user_store
+
+        try:
+            images = [db.fs.get(image_id).read() for image_id in job["image_ids"]]
+        except Exception as e:
+            self.queue.finish(job, {"status": STATUS_FAILED, "error": f"Images missing: {e}"})
+            return
+
+        parsed = ai_service.analyze_meal_images(images)
+        if parsed.get("retryable"):
+            # Rate limited or breaker open: put it back without using an attempt
+            self.queue.release(job)
+            self._stop.wait(JOB_POLL_SECONDS * 5)
+            return
+        if "error" in parsed:
+            self.queue.fail(job, parsed["error"])
+            return
+
+        warnings = parsed.pop("warnings", [])
+        # Keyed by the job, so a retry after a crash below does not save the meal twice
+        DataManager.save_meal_log(job["user_id"], job["meal_type"], parsed, job.get("notes", ""), job["_id"])
+
+        recommendation = None
+        user_doc = user_store.get(job["user_id"])
+        log_doc = DataManager.get_today_log(job["user_id"])
+        if user_doc and log_doc:
+            recommendation = ai_service.generate_recommendation(user_doc, log_doc)
+
+        self.queue.complete(job, {
+            "foods": parsed.get("foods", []),
+            "total_calories": parsed.get("total_calories", 0),
+            "warnings": warnings,
+            "recommendation": recommendation
+        })
+
+
+# Global job queue instance
+job_queue = JobQueue()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run NutriLens analysis workers")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    args = parser.parse_args()
+
+    pool = JobWorkerPool(job_queue, args.workers).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n Stopping workers...")
+        pool.stop()
\ No newline at end of file
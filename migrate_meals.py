@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Move embedded meals out of food_logs into the per-meal collection
+
+Usage:
+    python migrate_meals.py --dry-run
+    python migrate_meals.py --batch-size 500
+    python migrate_meals.py --rebuild-totals
+
+Set MEAL_STORAGE=per_meal and restart the app first: new meals then go
+to the meals collection and reads merge both layouts while this runs.
+
+Streams day documents that still embed meals, writes one compact
+document per meal to `meals` and leaves only the rollups on food_logs.
+Meal ids are the day document id plus a position that continues from
+the meals migrated from that day before (kept in `migrated_meals`), so
+an interrupted run can simply be started again.
+
+--rebuild-totals recomputes every day's rollups from the meals
+collection, e.g. after a failure between the meal insert and the rollup
+update of a per_meal write.
+"""
+
+import argparse
+import time
+from pymongo import ReplaceOne, UpdateOne
+
+from database import db
+from utils import DataManager
+
+
+def migrate(batch_size=500, dry_run=False):
+    """Returns (days migrated, meals written)"""
+    days = 0
+    meals = 0
+    meal_ops = []
+    log_ops = []
+
+    def flush():
+        if dry_run:
+            meal_ops.clear()
+            log_ops.clear()
+            return
+        # Meals first: a log only loses its embedded meals once they are stored
+        if meal_ops:
+            db.meals_col.bulk_write(meal_ops, ordered=False)
+        if log_ops:
+            db.food_logs_col.bulk_write(log_ops, ordered=False)
+        meal_ops.clear()
+        log_ops.clear()
+
+    cursor = db.food_logs_col.find(
+        {"meals.0": {"$exists": True}}, batch_size=batch_size, no_cursor_timeout=True
+    )
+    try:
+        for log in cursor:
+            # Positions continue after meals migrated from this day earlier, so
+            # meals pushed after a previous run never reuse an existing id
+            offset = log.get("migrated_meals", 0)
+            count = len(log["meals"])
+            for index, meal in enumerate(log["meals"]):
+                doc = DataManager.pack_meal(log["user_id"], log["date"], meal)
+                doc["_id"] = f"{log['_id']}:{offset + index}"
+                meal_ops.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+            meals += count
+            # Skipped if a meal was pushed meanwhile, the next run picks the day up again.
+            # Existing totals are kept: per_meal saves keep them current with their
+            # own updates, which a copy taken when the cursor read the log would erase
+            log_ops.append(UpdateOne(
+                {"_id": log["_id"], "meals": {"$size": count}},
+                [
+                    {"$set": {
+                        "totals": {"$ifNull": ["$totals", DataManager.legacy_totals()]},
+                        "migrated_meals": offset + count
+                    }},
+                    {"$unset": "meals"}
+                ]
+            ))
+            days += 1
+            if len(log_ops) >= batch_size:
+                flush()
+    finally:
+        cursor.close()
+    flush()
+    return days, meals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="Day documents per bulk write")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would move without writing")
+    parser.add_argument("--rebuild-totals", action="store_true", help="Recompute day rollups from the meals collection")
+    args = parser.parse_args()
+
+    if args.rebuild_totals:
+        start = time.perf_counter()
+        DataManager.rebuild_meal_rollups()
+        print(f" Rebuilt day rollups from the meals collection in {time.perf_counter() - start:.1f}s")
+        return
+
+    start = time.perf_counter()
+    days, meals = migrate(args.batch_size, args.dry_run)
+    action = "Would move" if args.dry_run else "Moved"
+    print(f" {action} {meals} meals from {days} day logs in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
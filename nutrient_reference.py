@@ -0,0 +1,219 @@
+"""
+Local nutrient reference table (per 100 g) with a fast food-name index
+"""
+
+import csv
+import os
+import re
+import threading
+from array import array
+from fractions import Fraction
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REFERENCE_PATH = os.getenv(
+    "NUTRIENT_REFERENCE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "nutrient_reference.csv")
+)
+REFERENCE_MIN_SCORE = float(os.getenv("NUTRIENT_REFERENCE_MIN_SCORE", 0.75))
+# Reference estimates further than this factor from the model's calories are not used
+REFERENCE_MAX_KCAL_RATIO = float(os.getenv("NUTRIENT_REFERENCE_MAX_KCAL_RATIO", 3))
+# Bump when matching or filling changes, cached analyses are keyed on it
+REFERENCE_VERSION = 2
+
+# Order of the per-100 g columns in the flat value array
+FIELDS = ("calories", "protein", "fat", "carbs")
+
+# Grams per unit, any other unit counts as servings of the food
+UNIT_GRAMS = {
+    "g": 1, "gm": 1, "gms": 1, "gram": 1, "grams": 1,
+    "kg": 1000, "mg": 0.001,
+    "oz": 28.35, "ounce": 28.35, "ounces": 28.35,
+    "lb": 453.6, "lbs": 453.6,
+    "ml": 1, "l": 1000, "litre": 1000, "liter": 1000,
+    "cup": 240, "cups": 240,
+    "bowl": 250, "bowls": 250, "katori": 150,
+    "glass": 250, "glasses": 250,
+    "plate": 300, "plates": 300,
+    "tbsp": 15, "tablespoon": 15, "tablespoons": 15,
+    "tsp": 5, "teaspoon": 5, "teaspoons": 5,
+}
+SIZE_FACTORS = {"small": 0.7, "medium": 1.0, "regular": 1.0, "large": 1.3, "big": 1.3}
+
+_QUANTITY = re.compile(r"(\d+\s+\d+\s*/\s*\d+|\d+\s*/\s*\d+|\d+(?:\.\d+)?)\s*-?\s*([a-z]+)?")
+_FRACTION_SLASH = re.compile(r"\s*/\s*")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name):
+    """Lowercase, strip punctuation and simple plurals"""
+    words = _NON_ALNUM.sub(" ", str(name).lower()).split()
+    return " ".join(w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words)
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def parse_quantity_grams(quantity, serving_g):
+    """Estimate grams from strings like "150 g", "1 1/2 cups" or "2 medium" """
+    text = str(quantity or "").lower()
+    match = _QUANTITY.search(text)
+    if not match:
+        factor = next((f for size, f in SIZE_FACTORS.items() if size in text), 1.0)
+        return serving_g * factor
+
+    # "1 1/2" is a whole number plus a fraction
+    amount = float(sum(Fraction(part) for part in _FRACTION_SLASH.sub("/", match.group(1)).split()))
+    unit = match.group(2) or ""
+    if unit in UNIT_GRAMS:
+        return amount * UNIT_GRAMS[unit]
+    return amount * serving_g * SIZE_FACTORS.get(unit, 1.0)
+
+
+class NutrientReference:
+    """
+    Array-backed reference table.
+
+    Values live in one flat float array (4 per entry), names resolve
+    through an exact normalized-name map and a trigram inverted index.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or REFERENCE_PATH
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        names = []
+        values = array("f")
+        serving = array("f")
+        exact = {}
+        variant_entry = array("I")
+        variant_size = array("H")
+        index = {}
+
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                entry = len(names)
+                names.append(row["name"])
+                values.extend(float(row[field]) for field in FIELDS)
+                serving.append(float(row["serving_g"] or 100))
+
+                variants = [row["name"]] + [a for a in row.get("aliases", "").split("|") if a]
+                for variant in variants:
+                    key = normalize_name(variant)
+                    exact.setdefault(key, entry)
+                    grams = trigrams(key)
+                    variant_id = len(variant_entry)
+                    variant_entry.append(entry)
+                    variant_size.append(len(grams))
+                    for gram in grams:
+                        index.setdefault(gram, array("I")).append(variant_id)
+
+        self.names = names
+        self.values = values
+        self.serving_g = serving
+        self._exact = exact
+        self._variant_entry = variant_entry
+        self._variant_size = variant_size
+        self._index = index
+        self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self.names)
+
+    def match(self, name, min_score=None):
+        """
+        Resolve a free-text food name to (entry, score), or None.
+        Exact names win, then the longest known trailing phrase (the head
+        noun: "fried egg" -> "egg"), then the trigram Dice coefficient.
+        """
+        self._ensure_loaded()
+        key = normalize_name(name)
+        if not key:
+            return None
+        entry = self._exact.get(key)
+        if entry is not None:
+            return entry, 1.0
+
+        # Longest trailing phrase we know ("basmati rice" -> "rice")
+        words = key.split()
+        for start in range(1, len(words)):
+            entry = self._exact.get(" ".join(words[start:]))
+            if entry is not None:
+                return entry, round((len(words) - start) / len(words), 2)
+
+        grams = trigrams(key)
+        counts = {}
+        for gram in grams:
+            for variant_id in self._index.get(gram, ()):
+                counts[variant_id] = counts.get(variant_id, 0) + 1
+        if not counts:
+            return None
+
+        best_variant, best_score = None, 0.0
+        for variant_id, common in counts.items():
+            score = 2 * common / (len(grams) + self._variant_size[variant_id])
+            if score > best_score:
+                best_variant, best_score = variant_id, score
+
+        if best_score >= (REFERENCE_MIN_SCORE if min_score is None else min_score):
+            return self._variant_entry[best_variant], best_score
+        return None
+
+    def per_100g(self, entry):
+        """Reference values per 100 g for an entry"""
+        self._ensure_loaded()
+        base = entry * len(FIELDS)
+        return {field: self.values[base + i] for i, field in enumerate(FIELDS)}
+
+    def estimate(self, name, quantity):
+        """Macros for a food name and quantity string, or None if unknown"""
+        found = self.match(name)
+        if found is None:
+            return None
+        entry, score = found
+        grams = parse_quantity_grams(quantity, self.serving_g[entry])
+        scale = grams / 100
+        estimate = {field: round(value * scale, 1) for field, value in self.per_100g(entry).items()}
+        estimate.update({"reference": self.names[entry], "grams": round(grams), "score": round(score, 2)})
+        return estimate
+
+    def fill_missing(self, foods):
+        """
+        Fill calories/protein/fat/carbs the model left out, in place.
+        Works on FoodItem records. When the model gave calories, filled
+        macros are scaled to them; an estimate too far off is not used.
+        """
+        for food in foods:
+            missing = [field for field in FIELDS if getattr(food, field) is None]
+            if not missing:
+                continue
+            estimate = self.estimate(food.item, food.quantity)
+            if estimate is None:
+                continue
+            scale = 1.0
+            if food.calories is not None:
+                if food.calories <= 0 or estimate["calories"] <= 0:
+                    continue
+                scale = food.calories / estimate["calories"]
+                if not 1 / REFERENCE_MAX_KCAL_RATIO <= scale <= REFERENCE_MAX_KCAL_RATIO:
+                    continue
+            for field in missing:
+                value = round(estimate[field] * scale, 1)
+                setattr(food, field, int(value) if float(value).is_integer() else value)
+        return foods
+
+
+# Global reference table, loaded on first lookup
+nutrient_reference = NutrientReference()
\ No newline at end of file
@@ -0,0 +1,193 @@
+"""
+Process-wide rate limiting and circuit breaking for AI calls
+"""
+
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AI_RATE_PER_SECOND = float(os.getenv("AI_RATE_PER_SECOND", 5))
+AI_BURST = int(os.getenv("AI_BURST", 10))
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", 8))
+AI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AI_QUEUE_TIMEOUT_SECONDS", 10))
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", 5))
+AI_BREAKER_RESET_SECONDS = float(os.getenv("AI_BREAKER_RESET_SECONDS", 30))
+
+
+class RateLimitedError(RuntimeError):
+    """Raised when a call could not get a slot before its deadline"""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised immediately while the upstream is considered down"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"AI service is temporarily unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, deadline):
+        """Take one token, waiting until the monotonic deadline at most"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate if self.rate > 0 else deadline - now
+                if now + wait > deadline:
+                    return False
+                self._cond.wait(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, fails fast for
+    `reset_timeout` seconds, then lets a single trial call through.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless the call may proceed"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if self.state == self.OPEN and elapsed >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpenError(max(0.0, self.reset_timeout - elapsed))
+
+    def release_trial(self):
+        """Free the half-open trial slot when the call never reached upstream"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class CallGuard:
+    """
+    Token bucket + concurrency cap + circuit breaker around a callable.
+    Calls queue for at most `queue_timeout` seconds before failing.
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrency=None, queue_timeout=None,
+                 failure_threshold=None, reset_timeout=None):
+        self.bucket = TokenBucket(rate or AI_RATE_PER_SECOND, burst or AI_BURST)
+        self.max_concurrency = int(max_concurrency or AI_MAX_CONCURRENCY)
+        self.semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self.queue_timeout = float(queue_timeout or AI_QUEUE_TIMEOUT_SECONDS)
+        self.breaker = CircuitBreaker(failure_threshold or AI_BREAKER_FAILURES,
+                                      reset_timeout or AI_BREAKER_RESET_SECONDS)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "failures": 0, "rate_limited": 0, "fast_failed": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _enter(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("fast_failed")
+            raise
+
+        deadline = time.monotonic() + self.queue_timeout
+        if not self.bucket.acquire(deadline):
+            self.breaker.release_trial()
+            self._count("rate_limited")
+            raise RateLimitedError("Too many AI requests right now, please try again")
+        if not self.semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self.breaker.release_trial()
+            self._count("rate_limited")
+            raise RateLimitedError("AI service is busy, please try again")
+        self._count("calls")
+
+    def _exit(self, failed):
+        self.semaphore.release()
+        if failed:
+            self._count("failures")
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn under the guard"""
+        self._enter()
+        failed = True
+        try:
+            result = fn(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self._exit(failed)
+
+    def stream(self, fn, *args, **kwargs):
+        """Iterate a generator function under the guard, holding the slot until it ends"""
+        self._enter()
+        failed = True
+        try:
+            for item in fn(*args, **kwargs):
+                yield item
+            failed = False
+        except GeneratorExit:
+            # Consumer stopped early, that's not an upstream failure
+            failed = False
+            raise
+        finally:
+            self._exit(failed)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["breaker_state"] = self.breaker.state
+        return stats
+
+
+# Shared by every session in the process
+ai_guard = CallGuard()
\ No newline at end of file
@@ -5,7 +5,6 @@ RUN THIS SCRIPT FIRST to setup MongoDB for NutriLens
 
 import sys
 import os
-import bcrypt
 from datetime import datetime
 
 # Add current directory to path
@@ -49,18 +48,26 @@ def setup_database():
             else:
                 print(f" Collection exists: {col_name}")
         
-        # Create indexes
         users_col = db["users"]
         food_logs_col = db["food_logs"]
         
-        # User indexes
-        users_col.create_index("username", unique=True)
-        users_col.create_index("email", unique=True)
-        print(" Created user indexes")
+        # Create indexes from the shared registry
+        from indexes import apply_indexes
+        for col_name, report in apply_indexes(db).items():
+            for index_name, status in report:
+                print(f" Index {col_name}.{index_name}: {status}")
         
-        # Food log indexes
-        food_logs_col.create_index([("user_id", 1), ("date", 1)])
-        print(" Created food log indexes")
+        # Add daily rollups to logs saved before they existed
+        from utils import DataManager
+        backfilled = DataManager.backfill_rollups()
+        if backfilled:
+            print(f" Added nutrition rollups to {backfilled} food logs")
+        
+        # Normalized names for account recovery
+        from auth import AuthManager
+        named = AuthManager.backfill_name_keys()
+        if named:
+            print(f" Added recovery name keys to {named} users")
         
         # Count existing users
         user_count = users_col.count_documents({})
@@ -69,12 +76,13 @@ def setup_database():
         if user_count == 0:
             print("\n Creating sample admin user...")
             
-            hashed_pw = bcrypt.hashpw(b"admin123", bcrypt.gensalt())
+            hashed_pw = AuthManager.hash_password("admin123")
             
             admin_user = {
                 "user_id_number": 1,
                 "username": "admin",
                 "name": "Admin User",
+                "name_key": "admin user",
                 "email": "admin@nutrilens.com",
                 "password_hash": hashed_pw,
                 "age": 30,
@@ -90,6 +98,8 @@ def setup_database():
             }
             
             users_col.insert_one(admin_user)
+            # Keep the user ID counter ahead of the admin's number
+            db["counters"].update_one({"_id": "user_id"}, {"$max": {"seq": 1}}, upsert=True)
             print("Created admin user:")
             print(f"   Username: admin")
             print(f"   Password: admin123")
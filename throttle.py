@@ -0,0 +1,182 @@
+"""
+Sliding-window login throttling per username and per client
+
+Failed logins are counted in fixed windows; the current window plus a
+weighted share of the previous one approximates a sliding window with
+three integers per key. Counters live in process memory by default, or
+in MongoDB (LOGIN_THROTTLE_BACKEND=mongo) to share them across processes.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", 300))
+LOGIN_MAX_FAILURES_PER_USER = int(os.getenv("LOGIN_MAX_FAILURES_PER_USER", 5))
+LOGIN_MAX_FAILURES_PER_CLIENT = int(os.getenv("LOGIN_MAX_FAILURES_PER_CLIENT", 20))
+LOGIN_THROTTLE_BACKEND = os.getenv("LOGIN_THROTTLE_BACKEND", "memory")
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", 100000))
+# Reverse proxies in front of the app that append to X-Forwarded-For, 0 ignores the header
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+
+
+class LoginThrottledError(RuntimeError):
+    """Raised when a username or client has too many recent failed logins"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed login attempts, try again in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def client_address(peer_address, forwarded_for="", trusted_hops=None):
+    """
+    Client address for throttling. X-Forwarded-For is client supplied, so
+    it is only read with trusted proxies configured, taking the entry the
+    outermost trusted proxy appended (the right-most untrusted hop).
+    """
+    trusted_hops = TRUSTED_PROXY_HOPS if trusted_hops is None else trusted_hops
+    if trusted_hops > 0 and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        if len(hops) >= trusted_hops:
+            return hops[-trusted_hops]
+    return peer_address
+
+
+class MemoryWindowStore:
+    """key -> (window index, current count, previous count), evicted periodically"""
+
+    def __init__(self, max_keys=None):
+        self.max_keys = max(1, int(max_keys or LOGIN_THROTTLE_MAX_KEYS))
+        self._data = {}
+        self._lock = threading.Lock()
+        self._swept_window = 0
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def incr(self, key, window):
+        with self._lock:
+            w, count, previous = self._data.pop(key, (window, 0, 0))
+            if w != window:
+                previous = count if w == window - 1 else 0
+                count = 0
+            # Re-inserted last, so the dict stays ordered by last failure
+            self._data[key] = (window, count + 1, previous)
+            if window != self._swept_window or len(self._data) > self.max_keys:
+                self._evict(window)
+
+    def _evict(self, window):
+        self._swept_window = window
+        for key in [k for k, (w, _, _) in self._data.items() if w < window - 1]:
+            del self._data[key]
+        while len(self._data) > self.max_keys:
+            del self._data[next(iter(self._data))]
+
+    def reset(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class MongoWindowStore:
+    """Same counters in a MongoDB collection, expired by a TTL index"""
+
+    def __init__(self, collection_name="login_throttle", window_seconds=None):
+        self.collection_name = collection_name
+        self.window_seconds = window_seconds or LOGIN_WINDOW_SECONDS
+
+    @property
+    def col(self):
+        from database import db
+        return db.db[self.collection_name]
+
+    def get(self, key):
+        doc = self.col.find_one({"_id": key})
+        return (doc["w"], doc["c"], doc["p"]) if doc else None
+
+    def incr(self, key, window):
+        # Single atomic pipeline update: roll the window over and count
+        self.col.update_one({"_id": key}, [{"$set": {
+            "p": {"$cond": [
+                {"$eq": ["$w", window]}, "$p",
+                {"$cond": [{"$eq": ["$w", window - 1]}, "$c", 0]}
+            ]},
+            "c": {"$cond": [{"$eq": ["$w", window]}, {"$add": ["$c", 1]}, 1]},
+            "w": window,
+            "expires_at": datetime.utcnow() + timedelta(seconds=2 * self.window_seconds)
+        }}], upsert=True)
+
+    def reset(self, key):
+        self.col.delete_one({"_id": key})
+
+
+class LoginThrottle:
+    def __init__(self, store=None, window_seconds=None, max_per_user=None, max_per_client=None):
+        self.window_seconds = window_seconds or LOGIN_WINDOW_SECONDS
+        self.max_per_user = max_per_user or LOGIN_MAX_FAILURES_PER_USER
+        self.max_per_client = max_per_client or LOGIN_MAX_FAILURES_PER_CLIENT
+        if store is None:
+            store = MongoWindowStore(window_seconds=self.window_seconds) if LOGIN_THROTTLE_BACKEND == "mongo" \
+                else MemoryWindowStore()
+        self.store = store
+
+    @staticmethod
+    def _keys(username, client):
+        keys = [f"u:{str(username).strip().lower()}"]
+        if client:
+            keys.append(f"c:{client}")
+        return keys
+
+    def _estimate(self, key, now, limit):
+        """
+        Failures in the sliding window ending now, and seconds until that
+        estimate drops below limit (assuming no further failures)
+        """
+        entry = self.store.get(key)
+        if entry is None:
+            return 0.0, 0.0
+        window = int(now // self.window_seconds)
+        elapsed = (now % self.window_seconds) / self.window_seconds
+        w, count, previous = entry
+        if w == window:
+            failures = count + previous * (1 - elapsed)
+            if count >= limit:
+                # Not before the rollover, then this window's count fades out too
+                until = 2 - limit / count
+            elif previous:
+                # The previous window's share fades out within this window
+                until = 1 - (limit - count) / previous
+            else:
+                until = elapsed
+        elif w == window - 1:
+            failures = count * (1 - elapsed)
+            until = 1 - limit / count
+        else:
+            return 0.0, 0.0
+        # until is the crossing point as a fraction of the current window
+        return failures, max(0.0, until - elapsed) * self.window_seconds
+
+    def check(self, username, client=None):
+        """Raise LoginThrottledError if the username or client is over its limit"""
+        now = time.time()
+        for key in self._keys(username, client):
+            limit = self.max_per_user if key.startswith("u:") else self.max_per_client
+            failures, retry_after = self._estimate(key, now, limit)
+            if failures >= limit:
+                raise LoginThrottledError(max(1.0, retry_after))
+
+    def record_failure(self, username, client=None):
+        window = int(time.time() // self.window_seconds)
+        for key in self._keys(username, client):
+            self.store.incr(key, window)
+
+    def record_success(self, username):
+        self.store.reset(self._keys(username, None)[0])
+
+
+# Global login throttle
+login_throttle = LoginThrottle()
\ No newline at end of file
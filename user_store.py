@@ -0,0 +1,59 @@
+"""
+Cached user profiles for sessions and workers
+"""
+
+import copy
+import os
+from dotenv import load_dotenv
+
+from cache import LRUCache
+from database import db
+
+load_dotenv()
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+
+# Profiles never carry the password hash outside auth
+USER_PROJECTION = {"password_hash": 0}
+
+
+class UserStore:
+    """
+    User documents keyed by username, cached in process for a short TTL.
+    Writes go through update() or invalidate() so this process never
+    serves a stale profile; other processes catch up within the TTL.
+    """
+
+    def __init__(self, max_size=None, ttl_seconds=None):
+        self._cache = LRUCache(max_size or USER_CACHE_SIZE, ttl_seconds or USER_CACHE_TTL_SECONDS)
+
+    def get(self, username):
+        """Profile without the password hash, or None"""
+        user = self._cache.get(username)
+        if user is None:
+            user = db.users_col.find_one({"username": username}, USER_PROJECTION)
+            if user is None:
+                return None
+            self._cache.set(username, user)
+        # Callers may edit their copy (e.g. session state)
+        return copy.deepcopy(user)
+
+    def prime(self, user):
+        """Cache a freshly loaded user document, minus the hash, and return a copy"""
+        user = {key: value for key, value in user.items() if key != "password_hash"}
+        self._cache.set(user["username"], user)
+        return copy.deepcopy(user)
+
+    def update(self, username, fields):
+        """Write fields through to MongoDB and drop the cached copy"""
+        result = db.users_col.update_one({"username": username}, {"$set": fields})
+        self.invalidate(username)
+        return result.modified_count > 0
+
+    def invalidate(self, username):
+        self._cache.pop(username)
+
+
+# Global user store
+user_store = UserStore()
\ No newline at end of file
@@ -2,9 +2,51 @@
 Utility functions and calculations
 """
 
+import os
 from datetime import date, datetime, timedelta
+from itertools import islice
+import numpy as np
 import pandas as pd
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 from database import db
+from food_records import to_number
+
+# Per-day rollup fields kept on each food_logs document
+ROLLUP_FIELDS = ("calories", "protein", "carbs", "fat", "meals")
+
+# "embedded" pushes meals into the day's food_logs document, "per_meal"
+# stores one compact document per meal in `meals` and keeps only the
+# rollups on food_logs
+MEAL_STORAGE = os.getenv("MEAL_STORAGE", "embedded")
+if MEAL_STORAGE not in ("embedded", "per_meal"):
+    raise ValueError(f"Unknown MEAL_STORAGE: {MEAL_STORAGE}")
+
+# Compact field names of per-meal documents
+MEAL_FIELDS = {"meal_name": "n", "time": "t", "total_calories": "kc", "protein": "p", "carbs": "c", "fat": "f", "notes": "no"}
+FOOD_FIELDS = {"item": "i", "quantity": "q", "calories": "kc", "protein": "p", "carbs": "c", "fat": "f", "nutrients": "nu"}
+MEAL_NUMBERS = ("total_calories", "protein", "carbs", "fat", "calories")
+
+# Flat rollup fields computed server-side from a food_logs document;
+# meal arrays are only read for legacy logs without totals
+ROLLUP_PROJECTION = {
+    "_id": 0,
+    "date": 1,
+    "calories": {"$ifNull": ["$totals.calories", {"$sum": "$meals.total_calories"}]},
+    "protein": {"$ifNull": ["$totals.protein", 0]},
+    "carbs": {"$ifNull": ["$totals.carbs", 0]},
+    "fat": {"$ifNull": ["$totals.fat", 0]},
+    "meals": {"$ifNull": ["$totals.meals", {"$size": {"$ifNull": ["$meals", []]}}]}
+}
+
+# Food log documents pulled per cursor batch by the analytics engine
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", 5000))
+
+# Range choices offered by the history view, in days
+HISTORY_RANGES = {"Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "Last year": 365}
+HISTORY_GRANULARITIES = ("day", "week", "month")
+# Days per page in the meal history browser
+HISTORY_PAGE_SIZE = min(100, max(1, int(os.getenv("HISTORY_PAGE_SIZE", 14))))
 
 class NutritionCalculator:
     ACTIVITY_MULTIPLIERS = {
@@ -14,6 +56,14 @@ class NutritionCalculator:
         "Very Active": 1.725
     }
     
+    # Share of daily calories from protein, carbs and fat per goal
+    MACRO_SPLITS = {
+        "weight_loss": {"protein": 0.30, "carbs": 0.40, "fat": 0.30},
+        "maintenance": {"protein": 0.20, "carbs": 0.50, "fat": 0.30},
+        "weight_gain": {"protein": 0.25, "carbs": 0.50, "fat": 0.25}
+    }
+    KCAL_PER_GRAM = {"protein": 4, "carbs": 4, "fat": 9}
+    
     @staticmethod
     def calculate_bmi(height_cm, weight_kg):
         """Calculate BMI"""
@@ -57,81 +107,523 @@ class NutritionCalculator:
         else:  # maintenance
             return int(tdee)
 
+    @staticmethod
+    def macro_targets(daily_calories, goal):
+        """Daily grams of protein, carbs and fat for a calorie target and goal"""
+        split = NutritionCalculator.MACRO_SPLITS.get(goal, NutritionCalculator.MACRO_SPLITS["maintenance"])
+        return {
+            macro: round(daily_calories * share / NutritionCalculator.KCAL_PER_GRAM[macro])
+            for macro, share in split.items()
+        }
+    
+    @staticmethod
+    def macro_ratios(protein, carbs, fat):
+        """Share of macro calories from each macro (0-1), all zero when nothing was eaten"""
+        kcal = {
+            "protein": protein * NutritionCalculator.KCAL_PER_GRAM["protein"],
+            "carbs": carbs * NutritionCalculator.KCAL_PER_GRAM["carbs"],
+            "fat": fat * NutritionCalculator.KCAL_PER_GRAM["fat"]
+        }
+        total = sum(kcal.values())
+        return {macro: (value / total if total else 0.0) for macro, value in kcal.items()}
+
 class DataManager:
     @staticmethod
-    def save_meal_log(user_id, meal_type, parsed_data, notes=""):
-        """Save meal to daily food log"""
-        today = date.today().isoformat()
+    def meal_totals(foods, total_calories):
+        """Calories and macros of one meal, coerced to numbers"""
+        return {
+            "calories": to_number(total_calories) or 0,
+            "protein": round(sum(to_number(f.get("protein")) or 0 for f in foods), 1),
+            "carbs": round(sum(to_number(f.get("carbs")) or 0 for f in foods), 1),
+            "fat": round(sum(to_number(f.get("fat")) or 0 for f in foods), 1)
+        }
+    
+    @staticmethod
+    def build_meal(meal_type, parsed_data, notes="", time=None):
+        """Meal sub-document plus the rollup increments it contributes"""
+        foods = parsed_data.get("foods", [])
+        totals = DataManager.meal_totals(foods, parsed_data.get("total_calories", 0))
         meal = {
             "meal_name": meal_type,
-            "time": datetime.now().strftime("%H:%M"),
-            "foods": parsed_data.get("foods", []),
-            "total_calories": parsed_data.get("total_calories", 0),
+            "time": time or datetime.now().strftime("%H:%M"),
+            "foods": foods,
+            "total_calories": totals["calories"],
+            "protein": totals["protein"],
+            "carbs": totals["carbs"],
+            "fat": totals["fat"],
             "notes": notes
         }
+        rollup_inc = {f"totals.{key}": value for key, value in totals.items()}
+        rollup_inc["totals.meals"] = 1
+        return meal, rollup_inc
+    
+    @staticmethod
+    def _pack(record, fields):
+        doc = {}
+        for name, short in fields.items():
+            value = record.get(name)
+            if name in MEAL_NUMBERS:
+                value = to_number(value)
+            # Empty values are left out and read back as defaults
+            if value not in (None, "", [], 0):
+                doc[short] = value
+        return doc
+    
+    @staticmethod
+    def pack_meal(user_id, day, meal):
+        """Compact per-meal document for the meals collection"""
+        doc = {"u": user_id, "d": day}
+        doc.update(DataManager._pack(meal, MEAL_FIELDS))
+        doc["fd"] = [DataManager._pack(food, FOOD_FIELDS) for food in meal.get("foods", [])]
+        return doc
+    
+    @staticmethod
+    def unpack_meal(doc):
+        """Meal dict in the embedded layout from a per-meal document"""
+        meal = {name: doc.get(short, 0 if name in MEAL_NUMBERS else "") for name, short in MEAL_FIELDS.items()}
+        meal["foods"] = []
+        for food in doc.get("fd", []):
+            item = {name: food.get(short, 0 if name in MEAL_NUMBERS else "") for name, short in FOOD_FIELDS.items()}
+            item["nutrients"] = food.get("nu", [])
+            meal["foods"].append(item)
+        return meal
+    
+    @staticmethod
+    def attach_meals(user_id, logs, projection=None):
+        """
+        Add per-meal documents to day logs as a meals list, after any
+        meals still embedded in them. No-op in embedded storage.
+        """
+        if MEAL_STORAGE != "per_meal" or not logs:
+            return logs
+        by_day = {log["date"]: log for log in logs}
+        cursor = db.meals_col.find(
+            {"u": user_id, "d": {"$in": list(by_day)}}, projection
+        ).sort([("d", 1), ("t", 1)])
+        for doc in cursor:
+            by_day[doc["d"]].setdefault("meals", []).append(DataManager.unpack_meal(doc))
+        return logs
+    
+    @staticmethod
+    def legacy_totals():
+        """Expression computing rollups from a log's embedded meals"""
+        def nested_sum(field):
+            return {"$sum": {"$map": {"input": "$meals", "in": {"$sum": f"$$this.foods.{field}"}}}}
         
-        # Check if log exists for today
-        log = db.food_logs_col.find_one({"user_id": user_id, "date": today})
+        return {
+            "calories": {"$sum": "$meals.total_calories"},
+            "protein": nested_sum("protein"),
+            "carbs": nested_sum("carbs"),
+            "fat": nested_sum("fat"),
+            "meals": {"$size": {"$ifNull": ["$meals", []]}}
+        }
+    
+    @staticmethod
+    def rollup_update(rollup_inc, meals=None):
+        """
+        Pipeline update adding rollup increments and appending meals.
+        Logs saved before rollups existed get their totals seeded from
+        their embedded meals first, so the increment never starts at zero.
+        """
+        added = {key: {"$add": [f"$totals.{key}", rollup_inc.get(f"totals.{key}", 0)]} for key in ROLLUP_FIELDS}
+        stages = [
+            {"$set": {"totals": {"$ifNull": ["$totals", DataManager.legacy_totals()]}}},
+            {"$set": {"totals": added}}
+        ]
+        if meals:
+            # $literal so user text such as notes is never read as a field path
+            stages[1]["$set"]["meals"] = {"$concatArrays": [{"$ifNull": ["$meals", []]}, {"$literal": meals}]}
+        return stages
+    
+    @staticmethod
+    def save_meal_log(user_id, meal_type, parsed_data, notes="", job_id=None):
+        """
+        Save meal to daily food log. With a job_id the save is idempotent:
+        a retried job finds its meal on the day and writes nothing.
+        """
+        today = date.today().isoformat()
+        meal, rollup_inc = DataManager.build_meal(meal_type, parsed_data, notes)
+        query = {"user_id": user_id, "date": today}
         
-        if log:
-            # Update existing log
-            db.food_logs_col.update_one(
-                {"_id": log["_id"]}, 
-                {"$push": {"meals": meal}}
-            )
+        if MEAL_STORAGE == "per_meal":
+            # Two writes: if the rollup update below fails the meal is stored
+            # without its totals, python migrate_meals.py --rebuild-totals repairs that
+            doc = DataManager.pack_meal(user_id, today, meal)
+            if job_id is not None:
+                doc["_id"] = job_id
+            try:
+                db.meals_col.insert_one(doc)
+            except DuplicateKeyError:
+                # Saved by an earlier attempt, the guard below covers the rollups
+                pass
+            update = DataManager.rollup_update(rollup_inc)
+            if job_id is not None:
+                query["saved_jobs"] = {"$ne": job_id}
+                update[1]["$set"]["saved_jobs"] = {"$concatArrays": [{"$ifNull": ["$saved_jobs", []]}, [job_id]]}
         else:
-            # Create new log
-            db.food_logs_col.insert_one({
-                "user_id": user_id, 
-                "date": today, 
-                "meals": [meal]
-            })
+            # One atomic upsert: creates the day document or appends to it,
+            # bumping the rollups in the same write
+            if job_id is not None:
+                meal["job_id"] = job_id
+                query["meals.job_id"] = {"$ne": job_id}
+            update = DataManager.rollup_update(rollup_inc, [meal])
+        # Concurrent upserts of a new day only stay one document because of the
+        # unique (user_id, date) index declared in indexes.py
+        try:
+            db.food_logs_col.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # Lost the insert race on that index, or the job's meal is already
+            # on the day: the day exists now and the guarded update is a no-op
+            db.food_logs_col.update_one(query, update)
         
         return True
     
+    @staticmethod
+    def bulk_import_meals(meals, chunk_size=1000):
+        """
+        Import historical meals with chunked bulk_write upserts.
+        meals is an iterable of dicts with user_id, date (YYYY-MM-DD),
+        meal_name and the analysis fields (foods, total_calories),
+        optionally time and notes. Returns (meals imported, days touched).
+        """
+        imported = 0
+        days = 0
+        chunk = {}
+        
+        def flush():
+            if not chunk:
+                return 0
+            if MEAL_STORAGE == "per_meal":
+                db.meals_col.insert_many([
+                    DataManager.pack_meal(user_id, day, meal)
+                    for (user_id, day), entry in chunk.items() for meal in entry["meals"]
+                ], ordered=False)
+            ops = [
+                UpdateOne(
+                    {"user_id": user_id, "date": day},
+                    DataManager.rollup_update(
+                        entry["inc"], None if MEAL_STORAGE == "per_meal" else entry["meals"]
+                    ),
+                    upsert=True
+                )
+                for (user_id, day), entry in chunk.items()
+            ]
+            db.food_logs_col.bulk_write(ops, ordered=False)
+            count = len(ops)
+            chunk.clear()
+            return count
+        
+        for record in meals:
+            meal, rollup_inc = DataManager.build_meal(
+                record.get("meal_name", "Meal"), record, record.get("notes", ""), record.get("time") or "00:00"
+            )
+            key = (record["user_id"], date.fromisoformat(str(record["date"])[:10]).isoformat())
+            entry = chunk.setdefault(key, {"meals": [], "inc": {}})
+            entry["meals"].append(meal)
+            for field, value in rollup_inc.items():
+                entry["inc"][field] = entry["inc"].get(field, 0) + value
+            imported += 1
+            
+            if len(chunk) >= chunk_size:
+                days += flush()
+        
+        days += flush()
+        return imported, days
+    
+    @staticmethod
+    def get_day_totals(log):
+        """Rollup totals of a food log, computed from meals for older logs"""
+        if not log:
+            return {key: 0 for key in ROLLUP_FIELDS}
+        if "totals" in log:
+            return {key: log["totals"].get(key, 0) for key in ROLLUP_FIELDS}
+        meals = log.get("meals", [])
+        totals = {key: 0 for key in ROLLUP_FIELDS}
+        for meal in meals:
+            meal_totals = DataManager.meal_totals(meal.get("foods", []), meal.get("total_calories", 0))
+            for key, value in meal_totals.items():
+                totals[key] += value
+        totals["meals"] = len(meals)
+        return totals
+    
+    @staticmethod
+    def backfill_rollups():
+        """Compute rollups server-side for logs saved before they existed"""
+        result = db.food_logs_col.update_many(
+            {"totals": {"$exists": False}},
+            [{"$set": {"totals": DataManager.legacy_totals()}}]
+        )
+        return result.modified_count
+    
+    @staticmethod
+    def merge_duplicate_day_logs():
+        """Fold food logs sharing a (user_id, date) into one document, returns days merged"""
+        pipeline = [
+            {"$group": {"_id": {"user_id": "$user_id", "date": "$date"}, "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+            {"$match": {"n": {"$gt": 1}}}
+        ]
+        merged = 0
+        for group in db.food_logs_col.aggregate(pipeline, allowDiskUse=True):
+            docs = list(db.food_logs_col.find({"_id": {"$in": group["ids"]}}).sort("_id", 1))
+            totals = {key: 0 for key in ROLLUP_FIELDS}
+            for doc in docs:
+                for key, value in DataManager.get_day_totals(doc).items():
+                    totals[key] += value
+            merged_fields = {"totals": totals}
+            meals = [meal for doc in docs for meal in doc.get("meals", [])]
+            if meals:
+                merged_fields["meals"] = meals
+            db.food_logs_col.update_one({"_id": docs[0]["_id"]}, {"$set": merged_fields})
+            db.food_logs_col.delete_many({"_id": {"$in": [doc["_id"] for doc in docs[1:]]}})
+            merged += 1
+        return merged
+    
+    @staticmethod
+    def rebuild_meal_rollups():
+        """
+        Recompute food_logs totals from the per-meal collection.
+        Repairs days where a per_meal write stored the meal but not its
+        rollup. Only meaningful once no day still embeds meals.
+        """
+        db.meals_col.aggregate([
+            {"$group": {
+                "_id": {"user_id": "$u", "date": "$d"},
+                "calories": {"$sum": {"$ifNull": ["$kc", 0]}},
+                "protein": {"$sum": {"$ifNull": ["$p", 0]}},
+                "carbs": {"$sum": {"$ifNull": ["$c", 0]}},
+                "fat": {"$sum": {"$ifNull": ["$f", 0]}},
+                "meals": {"$sum": 1}
+            }},
+            {"$project": {
+                "_id": 0,
+                "user_id": "$_id.user_id",
+                "date": "$_id.date",
+                "totals": {"calories": "$calories", "protein": "$protein", "carbs": "$carbs",
+                           "fat": "$fat", "meals": "$meals"}
+            }},
+            # Relies on the unique (user_id, date) index from indexes.py
+            {"$merge": {"into": "food_logs", "on": ["user_id", "date"],
+                        "whenMatched": "merge", "whenNotMatched": "insert"}}
+        ], allowDiskUse=True)
+    
     @staticmethod
     def get_today_log(user_id):
         """Get today's food log"""
         today = date.today().isoformat()
-        return db.food_logs_col.find_one({"user_id": user_id, "date": today})
+        log = db.food_logs_col.find_one({"user_id": user_id, "date": today})
+        return DataManager.attach_meals(user_id, [log])[0] if log else None
+    
+    @staticmethod
+    def history_pipeline(user_id, start_date, end_date, granularity="day"):
+        """Aggregation pipeline of macro totals per day, ISO week or month"""
+        if granularity not in HISTORY_GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        
+        pipeline = [
+            {"$match": {
+                "user_id": user_id,
+                "date": {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}
+            }},
+            # Only the rollups leave the document
+            {"$project": ROLLUP_PROJECTION}
+        ]
+        
+        if granularity == "day":
+            pipeline.append({"$set": {"period": "$date", "days": {"$cond": [{"$gt": ["$meals", 0]}, 1, 0]}}})
+        else:
+            # Periods are keyed and labelled by their first calendar day
+            if granularity == "week":
+                day = {"$dateFromString": {"dateString": "$date"}}
+                period_start = {"$dateToString": {"format": "%Y-%m-%d", "date": {"$dateFromParts": {
+                    "isoWeekYear": {"$isoWeekYear": day}, "isoWeek": {"$isoWeek": day}, "isoDayOfWeek": 1
+                }}}}
+            else:
+                period_start = {"$concat": [{"$substrCP": ["$date", 0, 7]}, "-01"]}
+            pipeline.append({"$group": {
+                "_id": period_start,
+                "first_logged": {"$min": "$date"},
+                "calories": {"$sum": "$calories"},
+                "protein": {"$sum": "$protein"},
+                "carbs": {"$sum": "$carbs"},
+                "fat": {"$sum": "$fat"},
+                "meals": {"$sum": "$meals"},
+                "days": {"$sum": {"$cond": [{"$gt": ["$meals", 0]}, 1, 0]}}
+            }})
+            pipeline.append({"$set": {"period": "$_id", "date": "$_id"}})
+            pipeline.append({"$unset": "_id"})
+        
+        pipeline.append({"$sort": {"date": 1}})
+        return pipeline
     
     @staticmethod
-    def get_weekly_data(user_id, days=7):
-        """Get food log data for last N days"""
-        today = date.today()
-        start_date = today - timedelta(days=days-1)
+    def get_history(user_id, start_date, end_date, granularity="day"):
+        """
+        Macro totals for a date range, aggregated in MongoDB.
+        Returns one dict per period with period, date (the day, or the
+        Monday / first of the month starting the period), calories, protein,
+        carbs, fat, meals and days (days with meals). Week and month rows
+        also carry first_logged, the earliest logged day in the period.
+        """
+        pipeline = DataManager.history_pipeline(user_id, start_date, end_date, granularity)
+        return list(db.food_logs_col.aggregate(pipeline))
+    
+    @staticmethod
+    def create_history_dataframe(history, daily_target, start_date, end_date, granularity="day"):
+        """
+        DataFrame for the history view. Calories is the average per logged
+        day of each period (the day's total for daily rows); daily rows
+        cover the whole range.
+        """
+        columns = ["Date", "Period", "Calories", "Total Calories", "Protein", "Carbs", "Fat",
+                   "Meals", "Days Logged", "Status"]
+        if not history:
+            return pd.DataFrame(columns=columns)
+        
+        df = pd.DataFrame(history).rename(columns={
+            "date": "Date", "calories": "Total Calories", "protein": "Protein", "carbs": "Carbs",
+            "fat": "Fat", "meals": "Meals", "days": "Days Logged"
+        })
+        df["Date"] = pd.to_datetime(df["Date"])
         
-        logs = db.food_logs_col.find({
-            "user_id": user_id,
-            "date": {"$gte": start_date.isoformat(), "$lte": today.isoformat()}
-        }).sort("date", 1)
+        if granularity == "day":
+            all_dates = pd.DataFrame({"Date": pd.date_range(start=start_date, end=end_date, freq="D")})
+            df = all_dates.merge(df, on="Date", how="left")
+            df = df.fillna({"Total Calories": 0, "Protein": 0, "Carbs": 0, "Fat": 0, "Meals": 0, "Days Logged": 0})
+            df["Period"] = df["Date"].dt.strftime("%a, %b %d")
+            df["Calories"] = df["Total Calories"]
+        else:
+            label = "Week of %b %d" if granularity == "week" else "%B %Y"
+            df["Period"] = df["Date"].dt.strftime(label)
+            df["Calories"] = (df["Total Calories"] / df["Days Logged"].clip(lower=1)).round()
         
-        return list(logs)
+        df["Status"] = df["Calories"].apply(lambda x: "Over Target" if x > daily_target else "Under/At Target")
+        return df[columns]
+    
+    @staticmethod
+    def get_history_page(user_id, before=None, page_size=None):
+        """
+        One page of past days, newest first, by keyset on (user_id, date).
+        Pass the returned cursor as `before` for the next page; it is None
+        on the last page. Only day totals and meal summaries are fetched.
+        """
+        page_size = page_size or HISTORY_PAGE_SIZE
+        query = {"user_id": user_id}
+        if before:
+            query["date"] = {"$lt": before}
+        
+        logs = list(
+            db.food_logs_col.find(
+                query,
+                {"_id": 0, "date": 1, "totals": 1, "meals.meal_name": 1, "meals.time": 1, "meals.total_calories": 1}
+            ).sort("date", -1).limit(page_size + 1)
+        )
+        next_cursor = logs[page_size - 1]["date"] if len(logs) > page_size else None
+        logs = DataManager.attach_meals(user_id, logs[:page_size], {"d": 1, "n": 1, "t": 1, "kc": 1})
+        return logs, next_cursor
+    
+    @staticmethod
+    def get_day_log(user_id, day):
+        """Full food log of one day"""
+        log = db.food_logs_col.find_one({"user_id": user_id, "date": day}, {"_id": 0})
+        return DataManager.attach_meals(user_id, [log])[0] if log else None
+
+
+class AnalyticsEngine:
+    """
+    Columnar per-day analytics over many users at once.
+
+    MongoDB projects food logs to flat rollups, read in cursor batches
+    straight into column blocks, then laid out as a users x days matrix
+    so trailing averages, target compliance and streaks are plain NumPy
+    operations.
+    """
+    
+    COLUMNS = ("calories", "protein", "carbs", "fat", "meals")
+    
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or ANALYTICS_BATCH_SIZE
+    
+    @staticmethod
+    def frame_from_records(records):
+        """Column frame from flat rollup records (see ROLLUP_PROJECTION)"""
+        frame = pd.DataFrame.from_records(records, columns=["user_id", "date", *AnalyticsEngine.COLUMNS])
+        for key in AnalyticsEngine.COLUMNS:
+            frame[key] = pd.to_numeric(frame[key], errors="coerce").fillna(0)
+        return frame
+    
+    def load(self, start_date, end_date, user_ids=None):
+        """
+        Daily rollups of the given users (all users when None) as a column
+        frame. MongoDB flattens the rollups; each cursor batch becomes one
+        block of columns.
+        """
+        match = {"date": {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}}
+        if user_ids is not None:
+            match["user_id"] = {"$in": list(user_ids)}
+        cursor = db.food_logs_col.aggregate(
+            [{"$match": match}, {"$project": dict(ROLLUP_PROJECTION, user_id=1)}],
+            batchSize=self.batch_size, allowDiskUse=True
+        )
+        blocks = []
+        while True:
+            batch = list(islice(cursor, self.batch_size))
+            if not batch:
+                break
+            blocks.append(self.frame_from_records(batch))
+        if not blocks:
+            return self.frame_from_records([])
+        return pd.concat(blocks, ignore_index=True)
+    
+    @staticmethod
+    def to_matrix(frame, start_date, end_date, column="calories"):
+        """
+        Dense users x days matrix of one column (0 where nothing was logged).
+        Returns (users index, matrix, logged mask).
+        """
+        days = (end_date - start_date).days + 1
+        users = pd.Index(frame["user_id"].unique())
+        rows = users.get_indexer(frame["user_id"])
+        offsets = (pd.to_datetime(frame["date"]) - pd.Timestamp(start_date)).dt.days.to_numpy()
+        matrix = np.zeros((len(users), days))
+        logged = np.zeros((len(users), days), dtype=bool)
+        matrix[rows, offsets] = frame[column].to_numpy(dtype=float)
+        logged[rows, offsets] = frame["meals"].to_numpy() > 0
+        return users, matrix, logged
+    
+    @staticmethod
+    def trailing_mean(matrix, logged, window):
+        """Mean per logged day over the last `window` days of each row"""
+        return matrix[:, -window:].sum(axis=1) / np.maximum(logged[:, -window:].sum(axis=1), 1)
     
     @staticmethod
-    def create_weekly_dataframe(weekly_logs, daily_target):
-        """Create DataFrame for weekly analysis"""
-        if not weekly_logs:
+    def run_lengths(mask):
+        """Length of the run of True values ending at each day"""
+        index = np.arange(mask.shape[1])
+        last_break = np.maximum.accumulate(np.where(mask, -1, index), axis=1)
+        return index - last_break
+    
+    def summarize(self, frame, targets, start_date, end_date):
+        """
+        Per-user report: averages, 7/30-day averages up to end_date,
+        target compliance and current/longest compliance streaks. Every
+        average is per logged day, days without a log do not count as 0 kcal.
+        targets maps user_id to daily calorie target.
+        """
+        if frame.empty:
             return pd.DataFrame()
+        users, calories, logged = self.to_matrix(frame, start_date, end_date)
+        target = pd.Series(targets).reindex(users).fillna(2000).to_numpy(dtype=float)[:, None]
+        
+        days_logged = logged.sum(axis=1)
+        compliant = logged & (calories <= target)
+        streaks = self.run_lengths(compliant)
         
-        data = []
-        for log in weekly_logs:
-            total_cal = sum([m.get("total_calories", 0) for m in log.get("meals", [])])
-            data.append({
-                "Date": pd.to_datetime(log["date"]),
-                "Calories": total_cal,
-                "Meals": len(log.get("meals", [])),
-                "Status": "Over Target" if total_cal > daily_target else "Under/At Target"
-            })
-        
-        df = pd.DataFrame(data)
-        
-        # Ensure all dates are present
-        if not df.empty:
-            all_dates = pd.date_range(start=df["Date"].min(), end=df["Date"].max(), freq='D')
-            df_full = pd.DataFrame({"Date": all_dates})
-            df_full = df_full.merge(df, on="Date", how="left").fillna({"Calories": 0, "Meals": 0, "Status": "Under/At Target"})
-            df_full["Day"] = df_full["Date"].dt.strftime("%a, %b %d")
-            return df_full
-        
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame({
+            "days_logged": days_logged,
+            "avg_calories": calories.sum(axis=1) / np.maximum(days_logged, 1),
+            "avg_7d": self.trailing_mean(calories, logged, 7),
+            "avg_30d": self.trailing_mean(calories, logged, 30),
+            "compliance": compliant.sum(axis=1) / np.maximum(days_logged, 1),
+            "current_streak": streaks[:, -1],
+            "longest_streak": streaks.max(axis=1),
+        }, index=users.rename("user_id"))
\ No newline at end of file